@@ -2,11 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import threading
-import tempfile
 import os
-import yt_dlp
 from kivy.logger import Logger
 from kivy.clock import Clock
+from downloader import fetch_to_cache, PRIORITY_USER
+from progressive import GrowingFileSource
+from transcode import Transcoder
+from crossfade import Crossfader
+import settings
 
 try:
     import vlc
@@ -20,14 +23,35 @@ except ImportError:
         PYGAME_AVAILABLE = False
 
 class AudioBackend:
-    def __init__(self):
+    PARSE_TIMEOUT_MS = 5000
+    PYGAME_EVENT_INTERVAL = 0.1  # đọc hàng đợi event của pygame khi đang phát
+    
+    def __init__(self, cache=None, download_manager=None, library=None):
         self.backend = None
+        self.cache = cache
+        self.download_manager = download_manager
+        self.library = library
         self.player = None
+        self.next_player = None  # player thứ hai giữ bài kế tiếp, tạm dừng ở đầu bài (gapless)
+        self.next_file = None
+        self.advance_callback = None  # fn(media_path) khi đã tự chuyển sang bài nạp sẵn
+        self.end_callback = None      # fn() khi bài hiện tại phát hết (gọi trên luồng Kivy)
+        self.error_callback = None    # fn(message) khi player báo lỗi
+        self.duration_callback = None # fn() khi biết duration của bài đang phát sau khi parse xong
+        self.pygame_end_event = None
+        self.pygame_event_check = None
+        self.crossfader = None
         self.current_file = None
         self.duration = 0
         self.position = 0
         self.volume = 0.7
         self.temp_files = []
+        self.prepared_media = {}  # path -> vlc.Media đã parse sẵn (prefetch)
+        self.stream_source = None
+        self.load_token = 0  # tăng mỗi lần load; luồng load cũ thấy token đổi thì bỏ kết quả
+        self.transcoder = None
+        self.durations = {}  # (path, mtime) -> duration (giây), khi không có library
+        self.parsing = {}    # path -> (media, event_manager) đang parse ở nền
         
         self.init_backend()
     
@@ -37,7 +61,21 @@ class AudioBackend:
             try:
                 self.vlc_instance = vlc.Instance('--intf=dummy')
                 self.player = self.vlc_instance.media_player_new()
+                self.next_player = self.vlc_instance.media_player_new()
+                for player in (self.player, self.next_player):
+                    events = player.event_manager()
+                    events.event_attach(
+                        vlc.EventType.MediaPlayerEndReached,
+                        lambda event, player=player: self._on_end_reached(player)
+                    )
+                    events.event_attach(
+                        vlc.EventType.MediaPlayerEncounteredError,
+                        lambda event, player=player: Clock.schedule_once(
+                            lambda dt: self._on_player_error(player, "VLC không phát được file"), 0
+                        )
+                    )
                 self.backend = "vlc"
+                self.crossfader = Crossfader(self)
                 Logger.info("AudioBackend: Sử dụng VLC backend")
                 return
             except Exception as e:
@@ -48,6 +86,19 @@ class AudioBackend:
                 pygame.mixer.pre_init(frequency=44100, size=-16, channels=2, buffer=1024)
                 pygame.mixer.init()
                 self.backend = "pygame"
+                # Event khi hết bài; hàng đợi event của pygame cần video subsystem (không mở cửa sổ)
+                try:
+                    pygame.display.init()
+                    self.pygame_end_event = pygame.USEREVENT + 1
+                    pygame.mixer.music.set_endevent(self.pygame_end_event)
+                except pygame.error as e:
+                    Logger.warning(f"AudioBackend: Không dùng được event của pygame, kiểm tra get_busy - {e}")
+                # Convert sẵn các định dạng pygame không đọc được (cần ffmpeg)
+                transcoder = Transcoder()
+                if transcoder.available():
+                    self.transcoder = transcoder
+                else:
+                    Logger.warning("AudioBackend: Không tìm thấy ffmpeg, pygame chỉ phát được mp3/ogg/wav")
                 Logger.info("AudioBackend: Sử dụng Pygame backend")
                 return
             except Exception as e:
@@ -58,6 +109,12 @@ class AudioBackend:
     
     def load_track(self, track_info, callback=None):
         """Load track từ URL hoặc file local"""
+        if self.crossfader:
+            self.crossfader.cancel()
+        self.close_stream()
+        self.load_token += 1
+        token = self.load_token
+        
         def load_thread():
             try:
                 url = track_info.get('url', '')
@@ -70,17 +127,34 @@ class AudioBackend:
                     # Download từ SoundCloud
                     media_path = self._download_track(url)
                 
+                if token != self.load_token:
+                    Logger.info(f"AudioBackend: Bỏ qua {title}, đã chọn bài khác")
+                    return
+                
                 self.current_file = media_path
+                self.stream_source = None
+                self._pygame_loaded = False
+                
+                # Không chờ parse: phát ngay, duration lấy từ cache hoặc điền sau khi parse xong
+                self.duration = self.get_cached_duration(media_path) or 0
                 
-                if self.backend == "vlc":
-                    media = self.vlc_instance.media_new(media_path)
+                if self.backend == "vlc" and media_path == self.next_file:
+                    # Bài này đã nạp sẵn ở player thứ hai: đổi player, play() sẽ phát ngay
+                    self.player.stop()
+                    self.player, self.next_player = self.next_player, self.player
+                    self.next_file = None
+                elif self.backend == "vlc":
+                    media = self.prepared_media.pop(media_path, None)
+                    if media is None:
+                        media = self.vlc_instance.media_new(media_path)
                     self.player.set_media(media)
-                    # Lấy duration
-                    media.parse()
-                    self.duration = media.get_duration() / 1000.0 if media.get_duration() > 0 else 0
+                    if not self.duration:
+                        self.parse_async(media, media_path)
                 else:
-                    # Pygame không thể lấy duration dễ dàng
-                    self.duration = 0
+                    # Dùng bản đã convert sẵn nếu có (convert ngay nếu nền chưa làm xong)
+                    if self.transcoder:
+                        media_path = self.transcoder.convert(media_path)
+                        self.current_file = media_path
                 
                 Clock.schedule_once(lambda dt: callback(True) if callback else None, 0)
                 
@@ -91,37 +165,244 @@ class AudioBackend:
         
         threading.Thread(target=load_thread, daemon=True).start()
     
-    def _download_track(self, url):
-        """Download track từ URL"""
-        temp_dir = tempfile.gettempdir()
+    def supports_streaming(self):
+        return self.backend == "vlc" and settings.PROGRESSIVE_PLAYBACK
+    
+    def load_stream(self, track_info, job, callback=None):
+        """Phát trong khi đang tải: chờ đủ đoạn đầu rồi cho VLC đọc file đang lớn dần"""
+        if self.crossfader:
+            self.crossfader.cancel()
+        self.close_stream()
+        self.load_token += 1
+        token = self.load_token
         
-        format_selector = 'bestaudio/best' if self.backend == "vlc" else 'worst[ext=mp4]/worst[ext=webm]/worst'
+        def stream_thread():
+            try:
+                job.wait_for_bytes(settings.PROGRESSIVE_PREFIX_BYTES, timeout=settings.PROGRESSIVE_TIMEOUT)
+                
+                # Có thể đã chờ tới PROGRESSIVE_TIMEOUT: người dùng chọn bài khác thì không đụng vào player
+                if token != self.load_token:
+                    Logger.info(f"AudioBackend: Bỏ qua stream {track_info.get('title', 'Unknown')}, đã chọn bài khác")
+                    return
+                
+                if job.status == job.DONE:
+                    # Tải xong (hoặc cache hit) trong lúc chờ: phát file bình thường
+                    media = self.vlc_instance.media_new(job.filepath)
+                    self.stream_source = None
+                    self.current_file = job.filepath
+                elif job.is_finished():
+                    raise RuntimeError(job.error or "Download bị hủy")
+                elif job.downloaded_bytes <= 0:
+                    raise RuntimeError("Hết thời gian chờ download")
+                else:
+                    source = GrowingFileSource(job, settings.PROGRESSIVE_TIMEOUT)
+                    media = source.create_media(self.vlc_instance)
+                    self.stream_source = source
+                    self.current_file = job.url
+                    Logger.info(f"AudioBackend: Phát progressive sau {job.downloaded_bytes} bytes")
+                
+                self.player.set_media(media)
+                self.duration = track_info.get('duration_s') or 0
+                
+                Clock.schedule_once(lambda dt: callback(True) if callback else None, 0)
+                
+            except Exception as e:
+                error_msg = str(e)
+                Logger.error(f"AudioBackend: Lỗi load stream - {error_msg}")
+                Clock.schedule_once(lambda dt: callback(False, error_msg) if callback else None, 0)
         
-        ydl_opts = {
-            'format': format_selector,
-            'outtmpl': os.path.join(temp_dir, 'music_%(id)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': False,
-        }
+        threading.Thread(target=stream_thread, daemon=True).start()
+    
+    def close_stream(self):
+        """Nhả callback đọc của VLC đang chờ dữ liệu, để stop()/set_media() không bị treo"""
+        if self.stream_source:
+            self.stream_source.close()
+    
+    def on_track_cached(self, media_path):
+        """Gọi sau mỗi lần download xong: pygame thì convert sẵn ở nền"""
+        if self.transcoder:
+            self.transcoder.submit(media_path)
+    
+    def prepare_media(self, media_path):
+        """Tạo sẵn media của bài sắp phát, parse ở nền nếu chưa biết duration"""
+        if self.backend == "pygame":
+            self.on_track_cached(media_path)
+            return
+        if self.backend != "vlc" or media_path in self.prepared_media:
+            return
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            media_path = ydl.prepare_filename(info)
-            
-            # Tìm file đã download
-            if not os.path.exists(media_path):
-                video_id = info.get('id', 'unknown')
-                for ext in ['.mp4', '.webm', '.m4a', '.mp3']:
-                    test_file = os.path.join(temp_dir, f'music_{video_id}{ext}')
-                    if os.path.exists(test_file):
-                        media_path = test_file
-                        break
-            
-            if media_path not in self.temp_files:
-                self.temp_files.append(media_path)
-            
-            return media_path
+        try:
+            media = self.vlc_instance.media_new(media_path)
+            self.prepared_media[media_path] = media
+            # Giữ số lượng media tạo sẵn ở mức nhỏ
+            while len(self.prepared_media) > 8:
+                self.prepared_media.pop(next(iter(self.prepared_media)))
+            if not self.get_cached_duration(media_path):
+                self.parse_async(media, media_path)
+        except Exception as e:
+            Logger.warning(f"AudioBackend: Lỗi chuẩn bị {media_path} - {e}")
+    
+    def preload_next(self, media_path):
+        """Nạp bài kế tiếp vào player thứ hai, mở sẵn và tạm dừng ở đầu bài"""
+        if self.backend != "vlc" or media_path == self.next_file:
+            return
+        if self.crossfader.is_fading():
+            # Player thứ hai còn đang phát đoạn cuối của bài trước: nạp khi fade xong
+            self.crossfader.pending_next = media_path
+            return
+        try:
+            media = self.prepared_media.pop(media_path, None) or self.vlc_instance.media_new(media_path)
+            media.add_option(':start-paused')
+            self.next_player.set_media(media)
+            self.next_player.audio_set_volume(int(self.volume * 100))
+            self.next_player.play()
+            self.next_file = media_path
+            if not self.get_cached_duration(media_path):
+                self.parse_async(media, media_path)
+            Logger.info(f"AudioBackend: Nạp sẵn bài kế tiếp {os.path.basename(media_path)}")
+            self.crossfader.arm()
+        except Exception as e:
+            self.next_file = None
+            Logger.warning(f"AudioBackend: Lỗi nạp sẵn {media_path} - {e}")
+    
+    def clear_next(self):
+        if self.backend != "vlc":
+            return
+        if self.crossfader.is_fading():
+            self.crossfader.pending_next = None
+        elif self.next_file:
+            self.next_player.stop()
+            self.next_file = None
+            self.crossfader.arm()
+    
+    def swap_to_next(self):
+        """Player thứ hai (bài nạp sẵn) thành player chính; trả về player cũ"""
+        old_player = self.player
+        self.player, self.next_player = self.next_player, old_player
+        self.current_file, self.next_file = self.next_file, None
+        self.stream_source = None
+        return old_player
+    
+    def notify_advance(self):
+        """Báo cho app biết đã tự chuyển sang bài kế tiếp (gọi trên luồng Kivy)"""
+        self.duration = self.get_cached_duration(self.current_file) or 0
+        Logger.info(f"AudioBackend: Chuyển bài liền mạch sang {os.path.basename(self.current_file)}")
+        if self.advance_callback:
+            self.advance_callback(self.current_file)
+    
+    def _on_end_reached(self, player):
+        """Chạy trên luồng event của VLC khi một player phát hết bài"""
+        if player is not self.player:
+            return
+        if self.next_file is None:
+            Clock.schedule_once(lambda dt: self._on_track_end(player), 0)
+            return
+        # Chỉ điều khiển player còn lại (không gọi lại player vừa phát xong từ callback của nó)
+        self.next_player.set_pause(0)
+        self.swap_to_next()
+        Clock.schedule_once(lambda dt: self._on_gapless_advance(player), 0)
+    
+    def _on_track_end(self, player=None):
+        # Bỏ qua nếu trong lúc chờ đã load bài khác
+        if player is not None and player is not self.player:
+            return
+        if self.end_callback:
+            self.end_callback()
+    
+    def _on_player_error(self, player, message):
+        if player is not self.player:
+            return
+        Logger.error(f"AudioBackend: {message} - {self.current_file}")
+        if self.error_callback:
+            self.error_callback(message)
+    
+    def _check_pygame_events(self, dt):
+        """Clock callback khi pygame đang phát: hết bài thì báo cho app"""
+        try:
+            if self.pygame_end_event is not None:
+                ended = bool(pygame.event.get(self.pygame_end_event))
+            else:
+                ended = not pygame.mixer.music.get_busy()
+        except pygame.error:
+            ended = not pygame.mixer.music.get_busy()
+        if ended:
+            self.pygame_event_check = None
+            self._on_track_end()
+            return False
+        return True
+    
+    def _stop_pygame_events(self):
+        if self.pygame_event_check:
+            self.pygame_event_check.cancel()
+            self.pygame_event_check = None
+        if self.pygame_end_event is not None:
+            # stop()/load() cũng sinh event hết bài: bỏ đi
+            try:
+                pygame.event.clear(self.pygame_end_event)
+            except pygame.error:
+                pass
+    
+    def _on_gapless_advance(self, old_player):
+        old_player.stop()
+        self.notify_advance()
+    
+    def parse_async(self, media, media_path):
+        """Parse trong luồng của VLC; kết quả xử lý trên luồng Kivy khi MediaParsedChanged"""
+        if media_path in self.parsing:
+            return
+        events = media.event_manager()
+        events.event_attach(
+            vlc.EventType.MediaParsedChanged,
+            lambda event: Clock.schedule_once(lambda dt: self.on_media_parsed(media, media_path), 0)
+        )
+        # Giữ tham chiếu tới media/event manager cho đến khi parse xong
+        self.parsing[media_path] = (media, events)
+        media.parse_with_options(vlc.MediaParseFlag.local, self.PARSE_TIMEOUT_MS)
+    
+    def on_media_parsed(self, media, media_path):
+        if self.parsing.pop(media_path, None) is None:
+            return
+        duration = media.get_duration()
+        if duration <= 0:
+            return
+        self.remember_duration(media_path, duration / 1000.0)
+        if self.current_file == media_path:
+            self.duration = duration / 1000.0
+            if self.duration_callback:
+                self.duration_callback()
+    
+    def get_cached_duration(self, media_path):
+        """Duration đã biết của file (chỉ dùng nếu mtime không đổi)"""
+        if self.library:
+            return self.library.get_duration(media_path)
+        try:
+            return self.durations.get((media_path, os.path.getmtime(media_path)))
+        except OSError:
+            return None
+    
+    def remember_duration(self, media_path, duration):
+        if self.library:
+            self.library.set_duration(media_path, duration)
+            return
+        try:
+            self.durations[(media_path, os.path.getmtime(media_path))] = duration
+        except OSError:
+            pass
+    
+    def get_format_selector(self):
+        """Có VLC hoặc có ffmpeg để convert cho pygame thì lấy chất lượng tốt nhất"""
+        if self.backend == "vlc" or self.transcoder:
+            return 'bestaudio/best'
+        return 'bestaudio[ext=mp3]/bestaudio[ext=ogg]/worst[ext=mp4]/worst[ext=webm]/worst'
+    
+    def _download_track(self, url):
+        """Download track từ URL vào cache"""
+        format_selector = self.get_format_selector()
+        if self.download_manager:
+            # Đi qua download manager để gắn vào job đang tải cùng URL (nếu có)
+            job = self.download_manager.submit(url, PRIORITY_USER, format_selector=format_selector)
+            return job.future.result()
+        return fetch_to_cache(url, self.cache, format_selector)
     
     def play(self):
         """Phát nhạc"""
@@ -131,11 +412,16 @@ class AudioBackend:
         try:
             if self.backend == "vlc":
                 self.player.play()
+                self.crossfader.arm()
             else:
+                self._stop_pygame_events()
                 if not hasattr(self, '_pygame_loaded') or not self._pygame_loaded:
                     pygame.mixer.music.load(self.current_file)
                     self._pygame_loaded = True
                 pygame.mixer.music.play()
+                self.pygame_event_check = Clock.schedule_interval(
+                    self._check_pygame_events, self.PYGAME_EVENT_INTERVAL
+                )
             return True
         except Exception as e:
             Logger.error(f"AudioBackend: Lỗi phát nhạc - {e}")
@@ -145,8 +431,10 @@ class AudioBackend:
         """Tạm dừng"""
         try:
             if self.backend == "vlc":
+                self.crossfader.cancel()
                 self.player.pause()
             else:
+                self._stop_pygame_events()
                 pygame.mixer.music.pause()
             return True
         except Exception as e:
@@ -157,9 +445,12 @@ class AudioBackend:
         """Dừng phát"""
         try:
             if self.backend == "vlc":
+                self.crossfader.cancel()
+                self.close_stream()
                 self.player.stop()
             else:
                 pygame.mixer.music.stop()
+                self._stop_pygame_events()
             self.position = 0
             self._pygame_loaded = False
             return True
@@ -171,8 +462,12 @@ class AudioBackend:
         """Đặt âm lượng (0-1)"""
         try:
             self.volume = max(0, min(1, volume))
-            if self.backend == "vlc":
+            if self.backend == "vlc" and self.crossfader.is_fading():
+                # Đang crossfade: tick tiếp theo sẽ áp volume mới theo curve
+                pass
+            elif self.backend == "vlc":
                 self.player.audio_set_volume(int(self.volume * 100))
+                self.next_player.audio_set_volume(int(self.volume * 100))
             else:
                 pygame.mixer.music.set_volume(self.volume)
             return True
@@ -184,7 +479,9 @@ class AudioBackend:
         """Đặt vị trí phát (0-1)"""
         try:
             if self.backend == "vlc":
+                self.crossfader.cancel()
                 self.player.set_position(max(0, min(1, position)))
+                self.crossfader.arm()
             # Pygame không hỗ trợ seek dễ dàng
             return True
         except Exception as e:
@@ -208,7 +505,8 @@ class AudioBackend:
             if self.backend == "vlc":
                 return self.player.get_time() / 1000.0
             else:
-                return 0
+                # get_pos: số ms đã phát từ lần play() gần nhất (-1 nếu chưa phát)
+                return max(pygame.mixer.music.get_pos(), 0) / 1000.0
         except:
             return 0
     
@@ -230,10 +528,13 @@ class AudioBackend:
         """Dọn dẹp tài nguyên"""
         try:
             self.stop()
+            self.clear_next()
             if self.backend == "pygame":
                 pygame.mixer.quit()
+            if self.transcoder:
+                self.transcoder.shutdown()
             
-            # Xóa temp files
+            # Xóa temp files (file trong cache được giữ lại cho lần sau)
             for temp_file in self.temp_files:
                 try:
                     if os.path.exists(temp_file):
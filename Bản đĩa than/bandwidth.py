@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+import settings
+
+class JobShare:
+    """Trạng thái token bucket và thông lượng của một job"""
+    def __init__(self, weight):
+        self.weight = weight
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.total_bytes = 0
+        self.window_bytes = 0
+        self.window_start = time.monotonic()
+        self.rate = 0.0   # bytes/s (trung bình trượt)
+        self.share = 0.0  # bytes/s được phép (0 = không giới hạn)
+
+class RateGovernor:
+    """Token bucket dùng chung cho mọi luồng download, chia băng thông theo trọng số
+
+    Mỗi job được phần cap * weight / tổng weight của các job đang chạy. Khi
+    max_rate = 0, cap là tốc độ tổng cao nhất từng đo được, và chỉ áp dụng khi
+    có từ hai job trở lên (một job thì luôn dùng hết đường truyền).
+    """
+    WINDOW = 0.5  # giây, chu kỳ cập nhật tốc độ
+    BURST = 0.5   # giây, dung lượng bucket tính theo phần băng thông
+
+    def __init__(self, max_rate=None):
+        self.max_rate = max_rate if max_rate is not None else settings.DOWNLOAD_MAX_RATE
+        self.peak_rate = 0.0
+        self.shares = {}
+        self.lock = threading.Lock()
+
+    def register(self, key, weight):
+        with self.lock:
+            self.shares[key] = JobShare(weight)
+
+    def unregister(self, key):
+        with self.lock:
+            self.shares.pop(key, None)
+
+    def set_weight(self, key, weight):
+        with self.lock:
+            share = self.shares.get(key)
+            if share:
+                share.weight = weight
+
+    def get_cap(self):
+        return self.max_rate or self.peak_rate
+
+    def consume(self, key, nbytes):
+        """Trừ token cho nbytes vừa tải; ngủ nếu job đang vượt phần của nó"""
+        delay = 0.0
+        with self.lock:
+            share = self.shares.get(key)
+            if share is None:
+                return
+            now = time.monotonic()
+            self._update_rate(share, nbytes, now)
+
+            cap = self.get_cap()
+            if cap <= 0 or (not self.max_rate and len(self.shares) < 2):
+                share.share = 0.0
+                share.tokens = 0.0
+                share.last_refill = now
+                return
+
+            total_weight = sum(s.weight for s in self.shares.values()) or 1
+            rate = cap * share.weight / total_weight
+            share.share = rate
+
+            burst = max(rate * self.BURST, 64 * 1024)
+            share.tokens = min(burst, share.tokens + (now - share.last_refill) * rate)
+            share.last_refill = now
+            share.tokens -= nbytes
+            if share.tokens < 0:
+                delay = -share.tokens / rate
+
+        if delay > 0:
+            time.sleep(min(delay, 5.0))
+
+    def _update_rate(self, share, nbytes, now):
+        share.total_bytes += nbytes
+        share.window_bytes += nbytes
+        elapsed = now - share.window_start
+        if elapsed < self.WINDOW:
+            return
+
+        current = share.window_bytes / elapsed
+        share.rate = current if share.rate == 0 else share.rate * 0.7 + current * 0.3
+        share.window_bytes = 0
+        share.window_start = now
+
+        aggregate = sum(s.rate for s in self.shares.values())
+        self.peak_rate = max(self.peak_rate, aggregate)
+
+    def get_stats(self, key):
+        """Thông lượng hiện tại của một job: {'rate', 'share', 'bytes', 'weight'}"""
+        with self.lock:
+            share = self.shares.get(key)
+            if share is None:
+                return None
+            return {
+                'rate': share.rate,
+                'share': share.share,
+                'bytes': share.total_bytes,
+                'weight': share.weight,
+            }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""So sánh thời gian vẽ mỗi frame của AudioVisualizer: một Mesh giữ nguyên (hiện tại)
+vs xóa canvas và tạo lại Color/Rectangle cho từng cột (cách cũ)
+
+Chạy: python bench_visualizer.py [so_cot] [so_giay_moi_che_do]
+"""
+
+import os
+import sys
+import time
+
+# Tham số của script không phải tham số của Kivy
+os.environ['KIVY_NO_ARGS'] = '1'
+
+from kivy.config import Config
+
+# Không giới hạn fps để đo được thời gian frame thật
+Config.set('graphics', 'maxfps', '0')
+Config.set('graphics', 'vsync', '0')
+
+from kivy.app import App
+from kivy.clock import Clock
+from kivy.graphics import Color, Rectangle
+from kivy.metrics import dp
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.widget import Widget
+
+from visualizer import AudioVisualizer
+
+class LegacyVisualizer(Widget):
+    """Cách vẽ cũ: canvas.clear() rồi tạo lại tối đa 3 Rectangle + 3 Color mỗi cột mỗi frame"""
+    def __init__(self, state, **kwargs):
+        super().__init__(**kwargs)
+        self.state = state  # AudioVisualizer không gắn vào cửa sổ, chỉ dùng phần mô phỏng
+
+    def update_graphics(self):
+        state = self.state
+        self.canvas.clear()
+
+        with self.canvas:
+            Color(0.02, 0.02, 0.08, 0.95)
+            Rectangle(pos=self.pos, size=self.size)
+
+            total_width = state.bar_count * (state.bar_width + state.bar_spacing)
+            start_x = self.center_x - total_width / 2
+
+            if total_width > self.width:
+                scale_factor = (self.width - dp(20)) / total_width
+                scaled_bar_width = state.bar_width * scale_factor
+                scaled_spacing = state.bar_spacing * scale_factor
+                start_x = self.x + dp(10)
+            else:
+                scaled_bar_width = state.bar_width
+                scaled_spacing = state.bar_spacing
+
+            amplitudes = state.audio_data.tolist()
+            colors = state.get_smooth_colors().tolist()
+
+            for i in range(state.bar_count):
+                bar_x = start_x + i * (scaled_bar_width + scaled_spacing)
+                amplitude = amplitudes[i]
+                bar_height = state.min_height + amplitude * (state.max_height - state.min_height)
+                bar_y = self.center_y - bar_height / 2
+                color = colors[i]
+
+                Color(*color)
+                Rectangle(pos=(bar_x, bar_y), size=(scaled_bar_width, bar_height))
+
+                if amplitude > 0.5:
+                    glow_size = dp(3)
+                    Color(color[0], color[1], color[2], (amplitude - 0.5) * 0.4)
+                    Rectangle(
+                        pos=(bar_x - glow_size / 2, bar_y - glow_size),
+                        size=(scaled_bar_width + glow_size, bar_height + glow_size * 2)
+                    )
+
+                if amplitude > 0.3:
+                    reflection_height = bar_height * 0.3 * amplitude
+                    Color(color[0], color[1], color[2], 0.15 * amplitude)
+                    Rectangle(
+                        pos=(bar_x, self.center_y - reflection_height),
+                        size=(scaled_bar_width, reflection_height)
+                    )
+
+def summarize(label, draw_times, frame_times):
+    draw_times.sort()
+    frame_times.sort()
+    median = draw_times[len(draw_times) // 2] * 1000
+    p95 = draw_times[int(len(draw_times) * 0.95)] * 1000
+    frame = frame_times[len(frame_times) // 2] * 1000
+    print(f"{label:7s} vẽ: median={median:6.2f} ms  p95={p95:6.2f} ms   frame median={frame:6.2f} ms "
+          f"({1000 / frame:5.0f} fps, {len(frame_times)} frame)")
+
+class BenchApp(App):
+    def __init__(self, bar_count, seconds, **kwargs):
+        super().__init__(**kwargs)
+        self.bar_count = bar_count
+        self.seconds = seconds
+        self.modes = ['mesh', 'legacy']
+
+    def build(self):
+        self.root_layout = BoxLayout()
+        Clock.schedule_once(lambda dt: self.next_mode(), 0.5)
+        return self.root_layout
+
+    def next_mode(self):
+        if not self.modes:
+            self.stop()
+            return
+        self.mode = self.modes.pop(0)
+        self.root_layout.clear_widgets()
+
+        self.state = AudioVisualizer(bar_count=self.bar_count)
+        self.renderer = self.state if self.mode == 'mesh' else LegacyVisualizer(self.state)
+        self.root_layout.add_widget(self.renderer)
+
+        self.draw_times = []
+        self.frame_times = []
+        self.started = time.perf_counter()
+        self.frame_event = Clock.schedule_interval(self.frame, 0)
+
+    def frame(self, dt):
+        if self.draw_times:
+            self.frame_times.append(dt)
+        self.state.time_accumulator += dt
+        self.state.generate_smooth_audio_data(dt)
+        self.state.apply_physics_smoothing(dt)
+
+        start = time.perf_counter()
+        self.renderer.update_graphics()
+        self.draw_times.append(time.perf_counter() - start)
+
+        if time.perf_counter() - self.started >= self.seconds:
+            summarize(self.mode, self.draw_times, self.frame_times)
+            self.frame_event.cancel()
+            Clock.schedule_once(lambda dt: self.next_mode(), 0.5)
+
+if __name__ == '__main__':
+    bar_count = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    print(f"AudioVisualizer {bar_count} cột, {seconds:.0f} giây mỗi chế độ")
+    BenchApp(bar_count, seconds).run()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""So sánh độ trễ mỗi lần tìm kiếm: tạo YoutubeDL mới mỗi lần vs mượn từ YdlPool
+
+Chạy: python bench_ydl_pool.py [query] [so_lan]
+"""
+
+import sys
+import time
+import tempfile
+import yt_dlp
+
+from ydl_pool import YdlPool, search_options
+
+def run_fresh(search_query):
+    with yt_dlp.YoutubeDL(search_options()) as ydl:
+        return ydl.extract_info(search_query, download=False)
+
+def run_pooled(pool, search_query):
+    with pool.borrow('search') as ydl:
+        return ydl.extract_info(search_query, download=False)
+
+def measure(label, func, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{label:8s} min={timings[0] * 1000:7.1f} ms  "
+          f"median={timings[len(timings) // 2] * 1000:7.1f} ms  max={timings[-1] * 1000:7.1f} ms")
+    return timings
+
+if __name__ == '__main__':
+    query = sys.argv[1] if len(sys.argv) > 1 else 'lofi'
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    search_query = f"scsearch5:{query}"
+
+    pool = YdlPool(tempfile.gettempdir(), search_size=1)
+    # Lần đầu của pool trả phí khởi tạo giống bản fresh; đo riêng để công bằng
+    run_pooled(pool, search_query)
+
+    fresh = measure('fresh', lambda: run_fresh(search_query), rounds)
+    pooled = measure('pooled', lambda: run_pooled(pool, search_query), rounds)
+
+    saved = fresh[len(fresh) // 2] - pooled[len(pooled) // 2]
+    print(f"Tiết kiệm mỗi lần gọi (median): {saved * 1000:.1f} ms")
+    pool.close()
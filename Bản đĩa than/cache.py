@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import threading
+from kivy.logger import Logger
+
+import settings
+
+class AudioCache:
+    """Cache audio trên đĩa, khóa theo id của extractor (SoundCloud track id)"""
+    INDEX_NAME = 'index.json'
+    CHECKPOINT_SUFFIX = '.resume.json'
+    CHECKPOINT_STEP = 512 * 1024  # ghi checkpoint mỗi 512 KB
+    QUARANTINE_KEEP = 20          # số file hỏng giữ lại để xem
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or settings.CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else settings.CACHE_MAX_BYTES
+        self.staging_dir = os.path.join(self.cache_dir, 'staging')
+        self.quarantine_dir = os.path.join(self.cache_dir, 'quarantine')
+        self.index_path = os.path.join(self.cache_dir, self.INDEX_NAME)
+        self.entries = {}    # track_id -> {'file', 'size', 'url', 'title', 'last_access'}
+        self.url_index = {}  # url -> track_id
+        self.lock = threading.RLock()
+        self.checkpoint_marks = {}  # key -> (bytes, fragment) đã ghi lần cuối
+        self.on_removed = None      # fn(path) khi file audio bị xóa khỏi cache (evict/quarantine)
+
+        os.makedirs(self.staging_dir, exist_ok=True)
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        self.load_index()
+
+    @staticmethod
+    def make_key(track_id):
+        """Chuẩn hóa id thành tên file an toàn"""
+        key = str(track_id)
+        for ch in (os.sep, '/', '\\', ':'):
+            key = key.replace(ch, '_')
+        return key
+
+    def load_index(self):
+        """Đọc index, bỏ các entry mà file đã bị xóa"""
+        with self.lock:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                return
+            except Exception as e:
+                Logger.warning(f"AudioCache: Index hỏng, tạo lại - {e}")
+                return
+
+            for track_id, entry in data.get('entries', {}).items():
+                if os.path.exists(os.path.join(self.cache_dir, entry.get('file', ''))):
+                    self.entries[track_id] = entry
+            self.url_index = {
+                url: track_id for url, track_id in data.get('urls', {}).items()
+                if track_id in self.entries
+            }
+
+    def save_index(self):
+        """Ghi index theo kiểu atomic (ghi file tạm rồi rename)"""
+        with self.lock:
+            data = {'entries': self.entries, 'urls': self.url_index}
+            tmp_path = self.index_path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path)
+            except Exception as e:
+                Logger.error(f"AudioCache: Lỗi ghi index - {e}")
+
+    def get(self, track_id):
+        """Trả về đường dẫn file đã cache hoặc None"""
+        with self.lock:
+            entry = self.entries.get(self.make_key(track_id))
+            if not entry:
+                return None
+            path = os.path.join(self.cache_dir, entry['file'])
+            if not os.path.exists(path):
+                self._drop(self.make_key(track_id))
+                return None
+            entry['last_access'] = time.time()
+            return path
+
+    def lookup_url(self, url):
+        """Tìm file đã cache theo URL (không cần gọi mạng để lấy id)"""
+        with self.lock:
+            track_id = self.url_index.get(url)
+            return self.get(track_id) if track_id else None
+
+    def remember_url(self, url, track_id):
+        with self.lock:
+            key = self.make_key(track_id)
+            if url and key in self.entries and self.url_index.get(url) != key:
+                self.url_index[url] = key
+                self.save_index()
+
+    def commit(self, track_id, staged_path, url=None, title=None):
+        """Chuyển file đã tải xong vào cache bằng os.replace (atomic)"""
+        key = self.make_key(track_id)
+        ext = os.path.splitext(staged_path)[1]
+        filename = f'{key}{ext}'
+        final_path = os.path.join(self.cache_dir, filename)
+
+        with self.lock:
+            # Tải lại cùng id: bỏ file cũ và các file phụ của nó trước
+            if key in self.entries:
+                self._drop(key)
+            os.replace(staged_path, final_path)
+
+            self.entries[key] = {
+                'file': filename,
+                'size': os.path.getsize(final_path),
+                'url': url,
+                'title': title,
+                'last_access': time.time(),
+            }
+            if url:
+                self.url_index[url] = key
+
+            self.evict(keep=key)
+            self.save_index()
+
+        Logger.info(f"AudioCache: Đã cache {key} -> {final_path}")
+        return final_path
+
+    def quarantine(self, path, reason):
+        """Chuyển file hỏng sang thư mục quarantine (kèm lý do) và bỏ khỏi index"""
+        name = os.path.basename(path)
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if entry['file'] == name:
+                    del self.entries[key]
+                    self.url_index = {url: k for url, k in self.url_index.items() if k != key}
+                    self.save_index()
+
+            target = os.path.join(self.quarantine_dir, f'{int(time.time())}_{name}')
+            try:
+                os.replace(path, target)
+                with open(target + '.reason.txt', 'w', encoding='utf-8') as f:
+                    f.write(reason)
+            except OSError as e:
+                Logger.error(f"AudioCache: Lỗi quarantine {name} - {e}")
+                return
+            self._trim_quarantine()
+            self._notify_removed(path)
+
+        Logger.warning(f"AudioCache: Quarantine {name} - {reason}")
+
+    def _trim_quarantine(self):
+        files = sorted(
+            (f for f in os.listdir(self.quarantine_dir) if not f.endswith('.reason.txt')),
+            key=lambda f: os.path.getmtime(os.path.join(self.quarantine_dir, f))
+        )
+        for name in files[:-self.QUARANTINE_KEEP]:
+            for path in (name, name + '.reason.txt'):
+                try:
+                    os.unlink(os.path.join(self.quarantine_dir, path))
+                except OSError:
+                    pass
+
+    def checkpoint_path(self, track_id):
+        return os.path.join(self.staging_dir, self.make_key(track_id) + self.CHECKPOINT_SUFFIX)
+
+    def load_checkpoint(self, track_id):
+        """Đọc sidecar của download dở dang (None nếu không có)"""
+        try:
+            with open(self.checkpoint_path(track_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            Logger.warning(f"AudioCache: Checkpoint hỏng {track_id} - {e}")
+            return None
+
+    def save_checkpoint(self, url, progress):
+        """Ghi offset đã tải (byte hoặc fragment) từ progress hook của yt-dlp"""
+        info = progress.get('info_dict') or {}
+        track_id = info.get('id')
+        if not track_id:
+            return
+
+        key = self.make_key(track_id)
+        downloaded = progress.get('downloaded_bytes') or 0
+        fragment = progress.get('fragment_index')
+        last_bytes, last_fragment = self.checkpoint_marks.get(key, (-self.CHECKPOINT_STEP, None))
+        if downloaded - last_bytes < self.CHECKPOINT_STEP and fragment == last_fragment:
+            return
+        self.checkpoint_marks[key] = (downloaded, fragment)
+
+        data = {
+            'id': track_id,
+            'url': url,
+            'title': info.get('title'),
+            'format_id': info.get('format_id'),
+            'ext': info.get('ext'),
+            'partial_path': progress.get('tmpfilename'),
+            'downloaded_bytes': downloaded,
+            'total_bytes': progress.get('total_bytes') or progress.get('total_bytes_estimate'),
+            'fragment_index': fragment,
+            'fragment_count': progress.get('fragment_count'),
+            'updated': time.time(),
+        }
+        path = self.checkpoint_path(track_id)
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            Logger.warning(f"AudioCache: Lỗi ghi checkpoint {key} - {e}")
+
+    def clear_checkpoint(self, track_id):
+        key = self.make_key(track_id)
+        self.checkpoint_marks.pop(key, None)
+        try:
+            os.unlink(self.checkpoint_path(track_id))
+        except OSError:
+            pass
+
+    def pending_checkpoints(self):
+        """Các download dở dang từ lần chạy trước"""
+        pending = []
+        for name in os.listdir(self.staging_dir):
+            if name.endswith(self.CHECKPOINT_SUFFIX):
+                checkpoint = self.load_checkpoint(name[:-len(self.CHECKPOINT_SUFFIX)])
+                if checkpoint and checkpoint.get('url') and not self.get(checkpoint.get('id', '')):
+                    pending.append(checkpoint)
+        return pending
+
+    def total_size(self):
+        with self.lock:
+            return sum(entry.get('size', 0) for entry in self.entries.values())
+
+    def evict(self, keep=None):
+        """Xóa các file ít dùng nhất (LRU) cho đến khi dưới giới hạn dung lượng"""
+        with self.lock:
+            total = self.total_size()
+            if total <= self.max_bytes:
+                return
+
+            by_age = sorted(self.entries.items(), key=lambda item: item[1].get('last_access', 0))
+            for key, entry in by_age:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                total -= entry.get('size', 0)
+                self._drop(key)
+                Logger.info(f"AudioCache: Evict {key}")
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if not entry:
+            return
+        # Xóa cả file gốc và các file phụ cùng key (vd. bản convert cho pygame)
+        prefix = key + '.'
+        for name in os.listdir(self.cache_dir):
+            if name == entry['file'] or name.startswith(prefix):
+                try:
+                    os.unlink(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+        self.url_index = {url: k for url, k in self.url_index.items() if k != key}
+        self._notify_removed(os.path.join(self.cache_dir, entry['file']))
+
+    def _notify_removed(self, path):
+        if self.on_removed:
+            self.on_removed(path)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+import settings
+
+def linear(t):
+    return 1.0 - t, t
+
+def equal_power(t):
+    """Tổng công suất không đổi: không bị hụt âm lượng ở giữa đoạn fade"""
+    return math.cos(t * math.pi / 2), math.sin(t * math.pi / 2)
+
+def s_curve(t):
+    s = t * t * (3 - 2 * t)
+    return 1.0 - s, s
+
+# curve(t) -> (gain bài đang hết, gain bài mới), t từ 0 đến 1
+CURVES = {
+    'linear': linear,
+    'equal_power': equal_power,
+    's_curve': s_curve,
+}
+
+class Crossfader:
+    """Bắt đầu bài kế tiếp (đã nạp sẵn ở player thứ hai) N giây trước khi bài hiện tại hết.
+    Tiến độ fade tính theo thời gian phát của player mới (audio clock), không theo đồng hồ tường."""
+    TICK = 1 / 30.0       # tần số cập nhật volume trong lúc fade
+    RETRY = 1.0           # chưa biết độ dài bài: kiểm tra lại sau 1 giây
+    START_TOLERANCE = 0.05
+
+    def __init__(self, backend, duration=None, curve=None, clock=None):
+        self.backend = backend
+        self.duration = duration if duration is not None else settings.CROSSFADE_SECONDS
+        self.curve = CURVES[curve or settings.CROSSFADE_CURVE]
+        self.clock = clock or Clock  # cần schedule_once/schedule_interval trả về event có cancel()
+        self.check_event = None
+        self.tick_event = None
+        self.outgoing = None
+        self.incoming = None
+        self.pending_next = None  # bài kế tiếp được yêu cầu nạp trong lúc player thứ hai còn đang fade
+
+    def enabled(self):
+        return self.duration > 0
+
+    def is_fading(self):
+        return self.outgoing is not None
+
+    def arm(self, *args):
+        """Hẹn giờ bắt đầu fade theo thời gian còn lại của bài; gọi lại sau play/seek/nạp bài"""
+        if self.check_event:
+            self.check_event.cancel()
+            self.check_event = None
+        if not self.enabled() or self.is_fading() or self.backend.next_file is None:
+            return
+
+        player = self.backend.player
+        length = player.get_length()
+        if length <= 0:
+            self.check_event = self.clock.schedule_once(self.arm, self.RETRY)
+            return
+
+        lead = (length - max(player.get_time(), 0)) / 1000.0 - self.duration
+        if lead > self.START_TOLERANCE:
+            # Đang pause thì tới giờ vẫn còn dư, arm() sẽ tự hẹn lại
+            self.check_event = self.clock.schedule_once(self.arm, lead)
+        else:
+            self.start()
+
+    def start(self):
+        self.incoming = self.backend.next_player
+        self.incoming.audio_set_volume(0)
+        self.incoming.set_pause(0)
+        self.outgoing = self.backend.swap_to_next()
+        self.tick_event = self.clock.schedule_interval(self.tick, self.TICK)
+        Logger.info(f"Crossfader: Bắt đầu crossfade {self.duration:.1f}s")
+        self.backend.notify_advance()
+
+    def tick(self, dt):
+        elapsed = max(self.incoming.get_time(), 0) / 1000.0
+        t = min(elapsed / self.duration, 1.0)
+        out_gain, in_gain = self.curve(t)
+        volume = self.backend.volume * 100
+        self.outgoing.audio_set_volume(int(volume * out_gain))
+        self.incoming.audio_set_volume(int(volume * in_gain))
+        if t >= 1.0:
+            self.finish()
+            return False
+        return True
+
+    def finish(self):
+        """Kết thúc fade ngay (hết giờ, hoặc người dùng chuyển bài giữa chừng)"""
+        if not self.is_fading():
+            return
+        if self.tick_event:
+            self.tick_event.cancel()
+            self.tick_event = None
+        self.outgoing.stop()
+        self.incoming.audio_set_volume(int(self.backend.volume * 100))
+        self.outgoing = self.incoming = None
+
+        pending, self.pending_next = self.pending_next, None
+        if pending:
+            self.backend.preload_next(pending)
+
+    def cancel(self):
+        """Bấm NEXT/PREV liên tục: dừng fade đang chạy, không chồng nhiều fade lên nhau"""
+        if self.check_event:
+            self.check_event.cancel()
+            self.check_event = None
+        self.finish()
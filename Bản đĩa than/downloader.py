@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+import yt_dlp
+from kivy.logger import Logger
+from kivy.clock import Clock
+
+import settings
+from ydl_pool import download_options
+from verify import VerificationError, verify_download, looks_like_audio
+
+# Số nhỏ hơn = ưu tiên cao hơn
+PRIORITY_USER = 0
+PRIORITY_PREFETCH = 5
+PRIORITY_BACKGROUND = 10
+
+# Trọng số băng thông theo priority: bài sắp nghe chiếm phần lớn đường truyền
+PRIORITY_WEIGHTS = {PRIORITY_USER: 8, PRIORITY_PREFETCH: 3, PRIORITY_BACKGROUND: 1}
+
+# File phụ của download dở dang, không phải file audio
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.resume.json', '.tmp')
+
+# Số lần tải lại khi file không qua được bước kiểm tra
+VERIFY_ATTEMPTS = 2
+
+def _checked_cache_hit(cache, path):
+    """File trong cache mà header hỏng thì cho vào quarantine và coi như miss"""
+    if path and not looks_like_audio(path):
+        cache.quarantine(path, "Header không hợp lệ khi đọc từ cache")
+        return None
+    return path
+
+def fetch_to_cache(url, cache, format_selector='bestaudio/best', progress_hook=None, claim_id=None,
+                   on_downloaded=None, pool=None):
+    """Download track vào cache, trả về đường dẫn file (cache hit thì không tải lại)
+
+    claim_id(track_id) trả về job khác đang tải cùng id (nếu có) để đợi job đó
+    thay vì tải lần nữa. on_downloaded(track_id, info, filepath) được gọi sau
+    mỗi lần tải mới thành công. Có pool thì mượn YoutubeDL từ pool thay vì tạo mới.
+    """
+    cached = _checked_cache_hit(cache, cache.lookup_url(url))
+    if cached:
+        Logger.info(f"Downloader: Cache hit {url}")
+        return cached
+
+    def checkpoint_hook(d):
+        if d.get('status') == 'downloading':
+            cache.save_checkpoint(url, d)
+
+    hooks = [checkpoint_hook]
+    if progress_hook:
+        hooks.append(progress_hook)
+
+    if pool:
+        context = pool.borrow('download', format_selector, hooks)
+    else:
+        ydl_opts = download_options(cache.staging_dir, format_selector)
+        ydl_opts['progress_hooks'] = hooks
+        context = yt_dlp.YoutubeDL(ydl_opts)
+
+    with context as ydl:
+        # Lấy id trước để kiểm tra cache, chưa tải gì
+        info = ydl.extract_info(url, download=False, process=False)
+        track_id = info.get('id', 'unknown')
+
+        cached = _checked_cache_hit(cache, cache.get(track_id))
+        if cached:
+            cache.remember_url(url, track_id)
+            Logger.info(f"Downloader: Cache hit {track_id}")
+            return cached
+
+        # URL khác nhưng cùng track id với một job đang tải: dùng chung kết quả
+        other = claim_id(track_id) if claim_id else None
+        if other is not None:
+            Logger.info(f"Downloader: {track_id} đang được tải bởi job khác, chờ kết quả")
+            filepath = other.future.result()
+            cache.remember_url(url, track_id)
+            return filepath
+
+        for attempt in range(VERIFY_ATTEMPTS):
+            # process_ie_result sửa dict info, mỗi lần tải dùng bản sao
+            downloaded, staged_path = _download_staged(ydl, copy.deepcopy(info), track_id, cache, format_selector)
+            try:
+                verify_download(staged_path, downloaded)
+                break
+            except VerificationError as e:
+                # File hỏng: cách ly, bỏ checkpoint, tải lại từ đầu
+                cache.quarantine(staged_path, str(e))
+                cache.clear_checkpoint(track_id)
+                if attempt == VERIFY_ATTEMPTS - 1:
+                    raise
+                Logger.warning(f"Downloader: {track_id} không hợp lệ ({e}), tải lại")
+        info = downloaded
+
+        filepath = cache.commit(track_id, staged_path, url=url, title=info.get('title'))
+        cache.clear_checkpoint(track_id)
+        if on_downloaded:
+            on_downloaded(track_id, info, filepath)
+        return filepath
+
+def _download_staged(ydl, info, track_id, cache, format_selector):
+    """Tải vào thư mục staging, trả về (info đã xử lý, đường dẫn file)"""
+    # Có checkpoint: chọn lại đúng format cũ để tải tiếp file .part
+    checkpoint = cache.load_checkpoint(track_id)
+    if checkpoint and checkpoint.get('format_id'):
+        ydl.params['format'] = checkpoint['format_id']
+        Logger.info(f"Downloader: Tải tiếp {track_id} từ {checkpoint.get('downloaded_bytes', 0)} bytes")
+    else:
+        ydl.params['format'] = format_selector
+
+    try:
+        downloaded = ydl.process_ie_result(info, download=True)
+    except yt_dlp.utils.DownloadError as e:
+        if not checkpoint or 'format is not available' not in str(e):
+            raise
+        # Format cũ không còn: bỏ checkpoint, tải lại từ đầu
+        cache.clear_checkpoint(track_id)
+        ydl.params['format'] = format_selector
+        downloaded = ydl.process_ie_result(info, download=True)
+
+    staged_path = None
+    for download in downloaded.get('requested_downloads') or []:
+        staged_path = download.get('filepath')
+    if not staged_path:
+        staged_path = ydl.prepare_filename(downloaded)
+
+    # Tìm file đã download nếu extension khác dự kiến
+    if not os.path.exists(staged_path):
+        prefix = f'{track_id}.'
+        for name in os.listdir(cache.staging_dir):
+            if name.startswith(prefix) and not name.endswith(PARTIAL_SUFFIXES):
+                staged_path = os.path.join(cache.staging_dir, name)
+                break
+        else:
+            raise FileNotFoundError(f"Không tìm thấy file đã tải cho {track_id}")
+
+    return downloaded, staged_path
+
+class DownloadJob:
+    """Một yêu cầu download và trạng thái của nó"""
+    QUEUED = 'queued'
+    RUNNING = 'downloading'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, url, priority, format_selector='bestaudio/best', title=None):
+        self.url = url
+        self.priority = priority
+        self.format_selector = format_selector
+        self.title = title
+        self.status = self.QUEUED
+        self.filepath = None
+        self.error = None
+        self.callbacks = []
+        self.subscribers = 1  # số lần submit() trả về job này; release() chỉ hủy khi còn 0
+        self.track_id = None
+        self.future = Future()  # caller khác có thể gắn vào thay vì tải lại
+
+        # Tiến độ download (cập nhật từ progress hook của yt-dlp)
+        self.partial_path = None
+        self.staged_path = None
+        self.downloaded_bytes = 0
+        self.total_bytes = 0
+        self.counted_bytes = 0  # số byte đã báo cho RateGovernor
+        self.progress = threading.Condition()
+
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED, self.CANCELLED)
+
+    def update_progress(self, d):
+        with self.progress:
+            self.partial_path = d.get('tmpfilename') or self.partial_path
+            self.staged_path = d.get('filename') or self.staged_path
+            self.downloaded_bytes = d.get('downloaded_bytes') or self.downloaded_bytes
+            self.total_bytes = d.get('total_bytes') or self.total_bytes
+            self.progress.notify_all()
+
+    def notify_finished(self):
+        with self.progress:
+            self.progress.notify_all()
+
+    def wait_for_bytes(self, count, timeout=None):
+        """Chờ đến khi tải được ít nhất count byte hoặc job kết thúc"""
+        with self.progress:
+            return self.progress.wait_for(
+                lambda: self.downloaded_bytes >= count or self.is_finished(), timeout
+            )
+
+class DownloadManager:
+    """Pool luồng cố định lấy job từ hàng đợi ưu tiên"""
+    def __init__(self, cache, workers=None, library=None, pool=None, governor=None):
+        self.cache = cache
+        self.library = library
+        self.pool = pool
+        self.governor = governor
+        self.post_processors = []  # fn(filepath), chạy trên luồng download sau mỗi lần tải mới
+        self.jobs = {}        # url -> job gần nhất
+        self.active_ids = {}  # track id -> job đang tải
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+
+        for i in range(workers or settings.DOWNLOAD_WORKERS):
+            threading.Thread(target=self._worker, name=f'download-{i}', daemon=True).start()
+
+    def submit(self, url, priority=PRIORITY_BACKGROUND, callback=None, title=None,
+               format_selector='bestaudio/best'):
+        """Thêm job vào hàng đợi; callback(job) được gọi trên Kivy thread khi xong
+
+        Nếu URL đang có job chưa xong thì không tạo job mới mà gắn vào job đó
+        (single-flight), đồng thời nâng priority nếu cần.
+        """
+        with self.condition:
+            existing = self.jobs.get(url)
+            if existing is not None and not existing.is_finished():
+                existing.subscribers += 1
+                if callback:
+                    existing.callbacks.append(callback)
+                self.raise_priority(existing, priority)
+                Logger.info(f"DownloadManager: Gắn vào job đang có {title or url}")
+                return existing
+
+            job = DownloadJob(url, priority, format_selector, title)
+            if callback:
+                job.callbacks.append(callback)
+            self.jobs[url] = job
+            heapq.heappush(self.heap, (priority, next(self.counter), job))
+            self.condition.notify()
+
+        Logger.info(f"DownloadManager: Queue {title or url} (priority={priority})")
+        return job
+
+    def raise_priority(self, job, priority=PRIORITY_USER):
+        """Đẩy job lên trước; entry cũ trong heap sẽ bị bỏ qua khi lấy ra
+
+        Job đang tải thì được tăng phần băng thông.
+        """
+        with self.condition:
+            if job.is_finished() or priority >= job.priority:
+                return False
+            job.priority = priority
+            if job.status == DownloadJob.QUEUED:
+                heapq.heappush(self.heap, (priority, next(self.counter), job))
+                self.condition.notify()
+            elif self.governor:
+                self.governor.set_weight(job, self.weight_for(priority))
+        Logger.info(f"DownloadManager: Raise priority {job.title or job.url} -> {priority}")
+        return True
+
+    def cancel(self, job):
+        """Hủy job chưa chạy (job đang tải thì để chạy nốt)"""
+        with self.condition:
+            if job.status != DownloadJob.QUEUED:
+                return False
+            job.status = DownloadJob.CANCELLED
+            callbacks = list(job.callbacks)
+        job.future.cancel()
+        Logger.info(f"DownloadManager: Cancel {job.title or job.url}")
+        job.notify_finished()
+        self._dispatch(job, callbacks)
+        return True
+
+    def release(self, job):
+        """Người đã submit() không cần job nữa: chỉ hủy khi không còn ai khác gắn vào"""
+        with self.condition:
+            job.subscribers -= 1
+            if job.subscribers > 0:
+                return False
+        return self.cancel(job)
+
+    def add_callback(self, job, callback):
+        """Gắn callback vào job; nếu job đã xong thì gọi luôn"""
+        with self.condition:
+            if not job.is_finished():
+                job.callbacks.append(callback)
+                return
+        self._dispatch(job, [callback])
+
+    def resume_pending(self):
+        """Đưa các download dở dang từ lần chạy trước vào lại hàng đợi"""
+        for checkpoint in self.cache.pending_checkpoints():
+            if self.get_job(checkpoint['url']) is None:
+                self.submit(checkpoint['url'], PRIORITY_BACKGROUND, title=checkpoint.get('title'))
+
+    @staticmethod
+    def weight_for(priority):
+        return PRIORITY_WEIGHTS.get(priority, 1)
+
+    def get_throughput(self):
+        """Thông lượng hiện tại của các job đang tải: [(job, stats)]"""
+        if not self.governor:
+            return []
+        with self.condition:
+            running = [job for job in self.jobs.values() if job.status == DownloadJob.RUNNING]
+        return [(job, self.governor.get_stats(job)) for job in running]
+
+    def get_job(self, url):
+        with self.condition:
+            return self.jobs.get(url)
+
+    def get_status(self, url):
+        job = self.get_job(url)
+        return job.status if job else None
+
+    def shutdown(self):
+        with self.condition:
+            self.running = False
+            for _, _, job in self.heap:
+                if job.status == DownloadJob.QUEUED:
+                    job.status = DownloadJob.CANCELLED
+                    job.future.cancel()
+            self.heap.clear()
+            self.condition.notify_all()
+
+    def _next_job(self):
+        with self.condition:
+            while self.running:
+                while self.heap:
+                    priority, _, job = heapq.heappop(self.heap)
+                    # Bỏ entry cũ (job đã được raise priority hoặc đã chạy)
+                    if job.status != DownloadJob.QUEUED or priority != job.priority:
+                        continue
+                    job.status = DownloadJob.RUNNING
+                    return job
+                self.condition.wait()
+            return None
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+
+            if self.governor:
+                self.governor.register(job, self.weight_for(job.priority))
+
+            try:
+                filepath = fetch_to_cache(
+                    job.url, self.cache, job.format_selector,
+                    lambda d, job=job: self._on_progress(job, d),
+                    claim_id=lambda track_id, job=job: self._claim_id(job, track_id),
+                    on_downloaded=lambda track_id, info, path, job=job: self._on_downloaded(job, track_id, info, path),
+                    pool=self.pool
+                )
+                status = DownloadJob.DONE
+            except Exception as e:
+                filepath = None
+                status = DownloadJob.FAILED
+                job.error = str(e)
+                Logger.error(f"DownloadManager: Lỗi download {job.title or job.url} - {e}")
+
+            if self.governor:
+                self.governor.unregister(job)
+
+            with self.condition:
+                job.filepath = filepath
+                job.status = status
+                callbacks = list(job.callbacks)
+                if job.track_id and self.active_ids.get(job.track_id) is job:
+                    del self.active_ids[job.track_id]
+
+            if status == DownloadJob.DONE:
+                job.future.set_result(filepath)
+            else:
+                job.future.set_exception(IOError(job.error))
+            job.notify_finished()
+            self._dispatch(job, callbacks)
+
+    def _on_progress(self, job, d):
+        job.update_progress(d)
+        if self.governor and d.get('status') == 'downloading':
+            downloaded = d.get('downloaded_bytes') or 0
+            delta = downloaded - job.counted_bytes
+            job.counted_bytes = downloaded
+            if delta > 0:
+                self.governor.consume(job, delta)
+
+    def add_post_processor(self, processor):
+        self.post_processors.append(processor)
+
+    def _on_downloaded(self, job, track_id, info, filepath):
+        if self.library:
+            self.library.record_download(track_id, job.url, filepath, info)
+        for processor in self.post_processors:
+            try:
+                processor(filepath)
+            except Exception as e:
+                Logger.error(f"DownloadManager: Lỗi post-process {filepath} - {e}")
+
+    def _claim_id(self, job, track_id):
+        """Đăng ký job cho track id; trả về job khác nếu id đó đang được tải"""
+        with self.condition:
+            other = self.active_ids.get(track_id)
+            if other is not None and other is not job and not other.is_finished():
+                return other
+            self.active_ids[track_id] = job
+            job.track_id = track_id
+            return None
+
+    def _dispatch(self, job, callbacks):
+        for callback in callbacks:
+            Clock.schedule_once(lambda dt, cb=callback: cb(job), 0)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import threading
+from kivy.logger import Logger
+
+import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    url TEXT,
+    local_path TEXT,
+    title TEXT,
+    artist TEXT,
+    duration_s REAL,
+    size INTEGER,
+    mtime REAL,
+    last_played REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_url ON tracks(url);
+CREATE INDEX IF NOT EXISTS idx_tracks_local_path ON tracks(local_path);
+CREATE INDEX IF NOT EXISTS idx_tracks_last_played ON tracks(last_played);
+"""
+
+COLUMNS = ('id', 'url', 'local_path', 'title', 'artist', 'duration_s', 'size', 'mtime', 'last_played')
+
+class Library:
+    """Thư viện các track đã download và file local, lưu trong SQLite"""
+    def __init__(self, db_path=None):
+        self.db_path = db_path or settings.LIBRARY_DB_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        # Một connection dùng chung cho các luồng download, có lock bảo vệ
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(SCHEMA)
+            self.conn.commit()
+
+    @staticmethod
+    def local_id(path):
+        return 'local:' + os.path.abspath(path)
+
+    @staticmethod
+    def to_track_info(row):
+        """Chuyển row thành dict track như kết quả tìm kiếm"""
+        if row is None:
+            return None
+        track = dict(row)
+        track['platform'] = 'Local' if track['id'].startswith('local:') else 'SoundCloud'
+        if not track.get('url'):
+            track['url'] = track['local_path']
+        return track
+
+    def upsert(self, track_id, **fields):
+        """Thêm hoặc cập nhật track; field None thì giữ giá trị cũ"""
+        local_path = fields.get('local_path')
+        if local_path:
+            local_path = fields['local_path'] = os.path.abspath(local_path)
+        if local_path and os.path.exists(local_path) and 'size' not in fields:
+            stat = os.stat(local_path)
+            fields['size'] = stat.st_size
+            fields['mtime'] = stat.st_mtime
+
+        fields = {k: v for k, v in fields.items() if k in COLUMNS and v is not None}
+        names = ['id'] + list(fields)
+        updates = ', '.join(f'{name} = excluded.{name}' for name in fields) or 'id = id'
+        sql = (f"INSERT INTO tracks ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+               f"ON CONFLICT(id) DO UPDATE SET {updates}")
+        try:
+            with self.lock:
+                self.conn.execute(sql, [str(track_id)] + list(fields.values()))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            Logger.error(f"Library: Lỗi ghi track {track_id} - {e}")
+
+    def record_download(self, track_id, url, local_path, info=None):
+        info = info or {}
+        self.upsert(
+            track_id,
+            url=url,
+            local_path=local_path,
+            title=info.get('title'),
+            artist=info.get('uploader') or info.get('artist'),
+            duration_s=info.get('duration'),
+        )
+
+    def add_local_file(self, path, title=None, artist=None, duration_s=None):
+        path = os.path.abspath(path)
+        self.upsert(
+            self.local_id(path),
+            local_path=path,
+            title=title or os.path.basename(path),
+            artist=artist or 'Local File',
+            duration_s=duration_s,
+        )
+        return self.find_by_path(path)
+
+    def upsert_many(self, tracks):
+        """Ghi nhiều file local trong một transaction (dùng cho scanner)"""
+        rows = [
+            (self.local_id(track['local_path']), os.path.abspath(track['local_path']), track.get('title'),
+             track.get('artist'), track.get('duration_s'), track.get('size'), track.get('mtime'))
+            for track in tracks
+        ]
+        sql = ("INSERT INTO tracks (id, local_path, title, artist, duration_s, size, mtime) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+               "local_path = excluded.local_path, title = excluded.title, artist = excluded.artist, "
+               "duration_s = COALESCE(excluded.duration_s, duration_s), "
+               "size = excluded.size, mtime = excluded.mtime")
+        try:
+            with self.lock:
+                self.conn.executemany(sql, rows)
+                self.conn.commit()
+        except sqlite3.Error as e:
+            Logger.error(f"Library: Lỗi ghi {len(rows)} track - {e}")
+
+    def remove_paths(self, paths):
+        """Xóa các file local không còn trên đĩa"""
+        if not paths:
+            return
+        try:
+            with self.lock:
+                self.conn.executemany('DELETE FROM tracks WHERE id = ?', [(self.local_id(path),) for path in paths])
+                self.conn.commit()
+        except sqlite3.Error as e:
+            Logger.error(f"Library: Lỗi xóa track - {e}")
+
+    def forget_path(self, path):
+        """File đã bị xóa (evict/quarantine khỏi cache, xóa ngoài app): file local thì bỏ hẳn,
+        bài đã tải thì giữ lại (url, tag) nhưng bỏ local_path để lần sau tải lại"""
+        path = os.path.abspath(path)
+        try:
+            with self.lock:
+                self.conn.execute('DELETE FROM tracks WHERE id = ?', (self.local_id(path),))
+                self.conn.execute('UPDATE tracks SET local_path = NULL WHERE local_path = ?', (path,))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            Logger.error(f"Library: Lỗi cập nhật track đã xóa - {e}")
+
+    def local_index(self):
+        """{local_path: (size, mtime)} của các file local, để scanner biết file nào đã đổi"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT local_path, size, mtime FROM tracks WHERE id LIKE 'local:%'"
+            ).fetchall()
+        return {row['local_path']: (row['size'], row['mtime']) for row in rows}
+
+    def _query_one(self, sql, params):
+        with self.lock:
+            row = self.conn.execute(sql, params).fetchone()
+        return self.to_track_info(row)
+
+    def _query_all(self, sql, params=()):
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self.to_track_info(row) for row in rows]
+
+    def get(self, track_id):
+        return self._query_one('SELECT * FROM tracks WHERE id = ?', (str(track_id),))
+
+    def find_by_url(self, url):
+        return self._query_one('SELECT * FROM tracks WHERE url = ?', (url,))
+
+    def find_by_path(self, path):
+        return self._query_one('SELECT * FROM tracks WHERE local_path = ?', (os.path.abspath(path),))
+
+    def recent(self, limit=50):
+        return self._query_all(
+            'SELECT * FROM tracks WHERE last_played IS NOT NULL ORDER BY last_played DESC LIMIT ?', (limit,)
+        )
+
+    def all_tracks(self):
+        return self._query_all('SELECT * FROM tracks ORDER BY title')
+
+    def search(self, query='', limit=200):
+        """Các track đã có trên máy, lọc theo title/artist"""
+        pattern = f'%{query}%'
+        return self._query_all(
+            'SELECT * FROM tracks WHERE local_path IS NOT NULL AND (title LIKE ? OR artist LIKE ?) '
+            'ORDER BY title LIMIT ?', (pattern, pattern, limit)
+        )
+
+    def get_duration(self, path):
+        """Duration đã lưu của file, None nếu chưa có hoặc file đã đổi (mtime khác)"""
+        path = os.path.abspath(path)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT duration_s, mtime FROM tracks WHERE local_path = ?', (path,)
+            ).fetchone()
+        if row and row['duration_s'] and row['mtime'] == mtime:
+            return row['duration_s']
+        return None
+
+    def set_duration(self, path, duration_s):
+        """Lưu duration đo được (kèm mtime hiện tại); file chưa có trong thư viện thì thêm vào"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        try:
+            with self.lock:
+                updated = self.conn.execute(
+                    'UPDATE tracks SET duration_s = ?, size = ?, mtime = ? WHERE local_path = ?',
+                    (duration_s, stat.st_size, stat.st_mtime, path)
+                ).rowcount
+                self.conn.commit()
+        except sqlite3.Error as e:
+            Logger.error(f"Library: Lỗi lưu duration - {e}")
+            return
+        if not updated:
+            self.add_local_file(path, duration_s=duration_s)
+
+    def mark_played(self, local_path):
+        try:
+            with self.lock:
+                self.conn.execute(
+                    'UPDATE tracks SET last_played = ? WHERE local_path = ?',
+                    (time.time(), os.path.abspath(local_path))
+                )
+                self.conn.commit()
+        except sqlite3.Error as e:
+            Logger.error(f"Library: Lỗi cập nhật last_played - {e}")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
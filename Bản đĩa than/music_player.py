@@ -5,8 +5,19 @@ from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager
 from kivy.clock import Clock
 from kivy.logger import Logger
+from kivy.core.window import Window
 
 from audio_backend import AudioBackend
+from cache import AudioCache
+from downloader import DownloadManager, DownloadJob, PRIORITY_USER
+from prefetch import Prefetcher
+from search_cache import SearchCache
+from library import Library
+from scanner import LibraryScanner
+from ydl_pool import YdlPool
+from bandwidth import RateGovernor
+from spectrum import SpectrumAnalyzer
+from waveform import WaveformPeaks
 from ui_search import SearchScreen
 from ui_player import PlayerScreen
 from utils import FileManager
@@ -16,7 +27,28 @@ class MusicPlayerApp(App):
         super().__init__(**kwargs)
         self.title = "SoundCloud Music Player"
         
-        self.audio_backend = AudioBackend()
+        self.audio_cache = AudioCache()
+        self.library = Library()
+        # File bi xoa khoi cache (evict/quarantine) thi thu vien khong con coi la da co tren may
+        self.audio_cache.on_removed = self.library.forget_path
+        self.library_scanner = LibraryScanner(self.library)
+        self.ydl_pool = YdlPool(self.audio_cache.staging_dir)
+        self.download_manager = DownloadManager(
+            self.audio_cache, library=self.library, pool=self.ydl_pool, governor=RateGovernor()
+        )
+        self.audio_backend = AudioBackend(
+            cache=self.audio_cache, download_manager=self.download_manager, library=self.library
+        )
+        self.download_manager.add_post_processor(self.audio_backend.on_track_cached)
+        # Duong bao min/max cho thanh seek, tinh mot lan luc tai xong va luu canh file cache
+        self.waveform = WaveformPeaks(cache_dir=self.audio_cache.cache_dir)
+        self.download_manager.add_post_processor(self.waveform.on_track_cached)
+        self.audio_backend.advance_callback = self.on_gapless_advance
+        self.audio_backend.end_callback = self.on_track_ended
+        self.audio_backend.error_callback = self.on_playback_error
+        self.audio_backend.duration_callback = self.on_duration_changed
+        self.prefetcher = Prefetcher(self.download_manager, self.audio_backend, on_ready=self.on_prefetch_ready)
+        self.search_cache = SearchCache()
         self.file_manager = FileManager()
         
         self.current_track = None
@@ -24,6 +56,10 @@ class MusicPlayerApp(App):
         self.current_index = 0
         self.is_playing = False
         self.repeat_mode = 0
+        self.streaming_job = None
+        self.ui_event = None
+        self.window_minimized = False
+        self.error_count = 0
         
     def build(self):
         self.sm = ScreenManager()
@@ -36,46 +72,69 @@ class MusicPlayerApp(App):
         
         self.sm.current = 'search'
         
-        Clock.schedule_interval(self.update_ui, 0.5)
+        # Pho that cho visualizer: tinh san thanh sidecar luc download, bai chua co thi giai ma o nen
+        self.spectrum_analyzer = SpectrumAnalyzer(
+            self.player_screen.visualizer.bar_count, cache_dir=self.audio_cache.cache_dir
+        )
+        self.download_manager.add_post_processor(self.spectrum_analyzer.on_track_cached)
+        self.player_screen.visualizer.spectrum_source = self.get_spectrum
+        
+        # Het bai duoc bao qua event cua backend; poll chi de cap nhat thanh tien do khi dang hien
+        self.sm.bind(current=lambda sm, current: self.update_ui_schedule())
+        Window.bind(on_minimize=lambda window: self.update_ui_schedule(minimized=True),
+                    on_restore=lambda window: self.update_ui_schedule(minimized=False))
+        self.update_ui_schedule()
+        
+        # Tao san YoutubeDL, tai tiep cac bai con dang do tu lan chay truoc
+        self.ydl_pool.warm()
+        self.download_manager.resume_pending()
+        # Quet lai thu muc nhac o nen, chi doc tag cua file moi/da sua
+        self.library_scanner.start()
         
         return self.sm
     
-    def get_downloaded_queue(self):
-        return [track for track in self.playlist if track.get('local_path')]
+    def update_ui_schedule(self, minimized=None):
+        """Chi chay poll cap nhat vi tri khi man hinh player dang hien"""
+        if minimized is not None:
+            self.window_minimized = minimized
+        visible = self.sm.current == 'player' and not self.window_minimized
+        if visible and not self.ui_event:
+            self.ui_event = Clock.schedule_interval(self.update_ui, 0.5)
+        elif not visible and self.ui_event:
+            self.ui_event.cancel()
+            self.ui_event = None
     
-    def get_current_index_in_downloaded_queue(self):
-        downloaded_queue = self.get_downloaded_queue()
-        if not downloaded_queue or not self.current_track:
-            return -1
-        
-        current_url = self.current_track.get('url', '')
-        for i, track in enumerate(downloaded_queue):
-            if track.get('url') == current_url or track.get('local_path') == current_url:
-                return i
-        return -1
+    def get_spectrum(self):
+        return self.spectrum_analyzer.get_bars(self.audio_backend.get_time())
     
     def update_ui(self, dt):
         if self.current_track and self.is_playing:
             if hasattr(self.player_screen, 'update_position'):
                 self.player_screen.update_position()
-            
-            if self.audio_backend.backend == "vlc":
-                import vlc
-                state = self.audio_backend.player.get_state()
-                if state == vlc.State.Ended:
-                    self.on_track_ended()
-            elif self.audio_backend.backend == "pygame":
-                import pygame
-                if not pygame.mixer.music.get_busy() and self.is_playing:
-                    self.on_track_ended()
+    
+    def on_duration_changed(self):
+        """Duration chi co sau khi parse xong (bai chua tung phat): cap nhat nhan va max cua slider"""
+        self.player_screen.update_track_info()
+    
+    def on_playback_error(self, message):
+        """Backend bao loi khi dang phat: bo qua bai loi, dung lai neu ca queue deu loi"""
+        title = self.current_track.get('title', 'Unknown') if self.current_track else 'Unknown'
+        Logger.error(f"MusicPlayer: Loi phat {title} - {message}")
+        self.error_count += 1
+        if len(self.playlist) > 1 and self.error_count < len(self.playlist):
+            self.next_track()
+        else:
+            self.error_count = 0
+            self.is_playing = False
+            self.player_screen.update_play_button()
     
     def on_track_ended(self):
+        self.error_count = 0
         if self.repeat_mode == 1:
             self.audio_backend.stop()
             Clock.schedule_once(lambda dt: self.restart_current_track(), 0.2)
         else:
-            downloaded_queue = self.get_downloaded_queue()
-            if len(downloaded_queue) > 1:
+            if len(self.playlist) > 1:
                 self.next_track()
             else:
                 self.is_playing = False
@@ -103,11 +162,15 @@ class MusicPlayerApp(App):
             self.playlist = playlist
             self.current_index = index
         
+        self.prefetcher.update(self.playlist, self.current_index)
+        
         track_to_play = track_info.copy()
         track_to_play['url'] = track_info['local_path']
         
+        self.streaming_job = None
         self.current_track = track_to_play
         self.audio_backend.load_track(track_to_play, self.on_track_loaded)
+        self.library.mark_played(track_info['local_path'])
         
         self.sm.current = 'player'
     
@@ -117,6 +180,8 @@ class MusicPlayerApp(App):
             self.is_playing = True
             self.player_screen.update_track_info()
             self.player_screen.update_play_button()
+            self.spectrum_analyzer.load(self.audio_backend.current_file)
+            self.preload_next_track()
             Logger.info(f"MusicPlayer: Dang phat {self.current_track.get('title', 'Unknown')}")
         else:
             Logger.error(f"MusicPlayer: Loi load track - {message}")
@@ -139,65 +204,154 @@ class MusicPlayerApp(App):
         self.is_playing = False
         self.player_screen.update_play_button()
     
-    def next_track(self):
-        downloaded_queue = self.get_downloaded_queue()
+    def play_queue_index(self, index, playlist=None):
+        """Phat bai thu index trong queue; neu chua download thi uu tien tai roi phat"""
+        if playlist is not None:
+            self.playlist = playlist
+        if not self.playlist:
+            return
+        
+        self.current_index = index
+        track = self.playlist[index]
         
-        if not downloaded_queue:
-            Logger.info("MusicPlayer: Khong co bai nao da download de next")
+        if track.get('local_path'):
+            self.play_track(track)
             return
         
-        if len(downloaded_queue) <= 1:
-            if self.repeat_mode == 1:
-                self.audio_backend.set_position(0)
-                return
-            else:
-                return
+        Logger.info(f"MusicPlayer: Cho download {track.get('title', 'Unknown')}")
+        self.prefetcher.update(self.playlist, index)
         
-        current_index = self.get_current_index_in_downloaded_queue()
+        # Neu dang co job cho URL nay thi submit chi nang priority cua job do
+        job = self.download_manager.submit(track.get('url'), PRIORITY_USER, title=track.get('title'))
         
-        if self.repeat_mode == 1:
-            self.audio_backend.set_position(0)
+        self.download_manager.add_callback(job, lambda job: self.on_queue_track_ready(index, track, job))
+        
+        if self.audio_backend.supports_streaming():
+            self.stream_track(track, job)
+    
+    def stream_track(self, track_info, job):
+        """Phat ngay khi da tai duoc doan dau, khong cho download xong"""
+        track_to_play = track_info.copy()
+        
+        self.streaming_job = job
+        self.current_track = track_to_play
+        self.audio_backend.load_stream(
+            track_to_play, job, lambda success, message="": self.on_stream_loaded(job, success, message)
+        )
+        
+        self.sm.current = 'player'
+    
+    def on_stream_loaded(self, job, success, message=""):
+        if self.streaming_job is not job:
+            # Trong luc cho doan dau nguoi dung da chon bai khac
+            return
+        if not success:
+            self.streaming_job = None
+        self.on_track_loaded(success, message)
+    
+    def on_queue_track_ready(self, index, track, job):
+        if job.status != DownloadJob.DONE:
+            Logger.error(f"MusicPlayer: Loi download {track.get('title', 'Unknown')} - {job.error}")
             return
         
-        next_index = (current_index + 1) % len(downloaded_queue)
-        next_track = downloaded_queue[next_index]
+        track['local_path'] = job.filepath
+        if self.streaming_job is job:
+            # Dang phat progressive tu chinh file nay, khong can load lai
+            self.current_track['local_path'] = job.filepath
+            self.spectrum_analyzer.load(job.filepath)
+            self.player_screen.load_waveform(job.filepath)
+            return
+        
+        # Chi phat neu nguoi dung chua chuyen sang bai khac trong luc cho
+        if index < len(self.playlist) and self.playlist[index] is track and self.current_index == index:
+            self.play_track(track)
+    
+    def on_queue_changed(self, playlist):
+        """Goi khi queue (cac bai tren dia) thay doi"""
+        current = None
+        if 0 <= self.current_index < len(self.playlist):
+            current = self.playlist[self.current_index]
         
-        for i, track in enumerate(self.playlist):
-            if track.get('url') == next_track.get('url'):
+        self.playlist = playlist
+        self.current_index = 0
+        for i, track in enumerate(playlist):
+            if track is current:
                 self.current_index = i
                 break
         
-        self.play_track(next_track)
+        if self.current_track:
+            self.prefetcher.update(self.playlist, self.current_index)
+            self.preload_next_track()
+        else:
+            self.prefetcher.clear()
     
-    def previous_track(self):
-        downloaded_queue = self.get_downloaded_queue()
-        
-        if not downloaded_queue:
-            Logger.info("MusicPlayer: Khong co bai nao da download de previous")
+    def preload_next_track(self):
+        """Nap san bai ke tiep vao player thu hai de chuyen bai khong co khoang lang"""
+        if self.repeat_mode == 1 or len(self.playlist) <= 1:
+            self.audio_backend.clear_next()
             return
         
-        if len(downloaded_queue) <= 1:
-            if self.repeat_mode == 1:
-                self.audio_backend.set_position(0)
-                return
-            else:
+        track = self.playlist[(self.current_index + 1) % len(self.playlist)]
+        if track.get('local_path'):
+            self.audio_backend.preload_next(track['local_path'])
+        else:
+            self.audio_backend.clear_next()
+    
+    def on_prefetch_ready(self, track):
+        if self.current_track and self.playlist:
+            self.preload_next_track()
+    
+    def on_gapless_advance(self, media_path):
+        """Backend da tu chuyen sang bai nap san ngay khi bai truoc ket thuc"""
+        index = (self.current_index + 1) % len(self.playlist) if self.playlist else 0
+        if not self.playlist or self.playlist[index].get('local_path') != media_path:
+            # Queue vua doi: tim lai vi tri cua bai dang phat
+            index = next((i for i, t in enumerate(self.playlist) if t.get('local_path') == media_path), None)
+            if index is None:
+                Logger.warning("MusicPlayer: Bai dang phat khong con trong queue")
                 return
         
-        current_index = self.get_current_index_in_downloaded_queue()
+        track = self.playlist[index]
+        self.current_index = index
+        self.current_track = track.copy()
+        self.current_track['url'] = track['local_path']
+        self.streaming_job = None
+        self.error_count = 0
+        
+        self.prefetcher.update(self.playlist, self.current_index)
+        self.library.mark_played(media_path)
+        self.spectrum_analyzer.load(self.audio_backend.current_file)
+        self.player_screen.update_track_info()
+        self.preload_next_track()
+        Logger.info(f"MusicPlayer: Dang phat {track.get('title', 'Unknown')}")
+    
+    def next_track(self):
+        if not self.playlist:
+            Logger.info("MusicPlayer: Queue trong, khong co bai de next")
+            return
         
         if self.repeat_mode == 1:
             self.audio_backend.set_position(0)
             return
         
-        prev_index = (current_index - 1) % len(downloaded_queue)
-        prev_track = downloaded_queue[prev_index]
+        if len(self.playlist) <= 1:
+            return
         
-        for i, track in enumerate(self.playlist):
-            if track.get('url') == prev_track.get('url'):
-                self.current_index = i
-                break
+        self.play_queue_index((self.current_index + 1) % len(self.playlist))
+    
+    def previous_track(self):
+        if not self.playlist:
+            Logger.info("MusicPlayer: Queue trong, khong co bai de previous")
+            return
+        
+        if self.repeat_mode == 1:
+            self.audio_backend.set_position(0)
+            return
+        
+        if len(self.playlist) <= 1:
+            return
         
-        self.play_track(prev_track)
+        self.play_queue_index((self.current_index - 1) % len(self.playlist))
     
     def set_volume(self, volume):
         self.audio_backend.set_volume(volume)
@@ -206,6 +360,13 @@ class MusicPlayerApp(App):
         self.audio_backend.set_position(position)
     
     def on_stop(self):
+        self.spectrum_analyzer.shutdown()
+        self.waveform.shutdown()
+        self.prefetcher.clear()
+        self.download_manager.shutdown()
         self.audio_backend.cleanup()
         self.file_manager.cleanup_temp_files()
+        self.audio_cache.save_index()
+        self.library.close()
+        self.ydl_pool.close()
         return True
\ No newline at end of file
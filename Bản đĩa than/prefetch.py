@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from kivy.logger import Logger
+
+import settings
+from downloader import DownloadJob, PRIORITY_PREFETCH
+
+class Prefetcher:
+    """Giữ N bài tiếp theo trong queue luôn được tải và parse sẵn"""
+    def __init__(self, download_manager, audio_backend, depth=None, on_ready=None):
+        self.download_manager = download_manager
+        self.audio_backend = audio_backend
+        self.on_ready = on_ready  # fn(track) khi một bài trong cửa sổ tải xong
+        self.depth = depth if depth is not None else settings.PREFETCH_DEPTH
+        self.jobs = {}      # url -> job đang theo dõi
+        self.owned = set()  # url của các job prefetcher đã submit (nhả bằng release khi ra khỏi cửa sổ)
+
+    def get_window(self, playlist, current_index):
+        """Các bài tiếp theo sau current_index (vòng lại đầu queue)"""
+        count = min(self.depth, len(playlist) - 1)
+        return [playlist[(current_index + offset) % len(playlist)] for offset in range(1, count + 1)]
+
+    def update(self, playlist, current_index):
+        """Gọi mỗi khi current_index hoặc queue thay đổi"""
+        window = self.get_window(playlist, current_index) if playlist else []
+        wanted = {track.get('url') for track in window}
+
+        # Queue đã đổi: nhả các job không còn nằm trong cửa sổ
+        # (chỉ bị hủy nếu không có ai khác, vd. download nền của màn hình tìm kiếm, cũng đang chờ)
+        for url in list(self.jobs):
+            if url not in wanted:
+                job = self.jobs.pop(url)
+                if url in self.owned:
+                    self.owned.discard(url)
+                    self.download_manager.release(job)
+
+        for track in window:
+            url = track.get('url')
+            if track.get('local_path'):
+                self.audio_backend.prepare_media(track['local_path'])
+                continue
+            if not url or url in self.jobs:
+                continue
+
+            job = self.download_manager.get_job(url)
+            if job is None or job.status in (DownloadJob.FAILED, DownloadJob.CANCELLED):
+                job = self.download_manager.submit(url, PRIORITY_PREFETCH, title=track.get('title'))
+                self.owned.add(url)
+            else:
+                self.download_manager.raise_priority(job, PRIORITY_PREFETCH)
+
+            self.jobs[url] = job
+            self.download_manager.add_callback(job, lambda job, track=track: self.on_job_done(track, job))
+
+        if window:
+            Logger.info(f"Prefetcher: Theo dõi {len(self.jobs)} job, cửa sổ {len(window)} bài")
+
+    def on_job_done(self, track, job):
+        url = track.get('url')
+        if self.jobs.get(url) is job:
+            del self.jobs[url]
+            self.owned.discard(url)
+
+        if job.status == DownloadJob.DONE:
+            track['local_path'] = job.filepath
+            self.audio_backend.prepare_media(job.filepath)
+            if self.on_ready:
+                self.on_ready(track)
+
+    def clear(self):
+        self.update([], 0)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import ctypes
+from kivy.logger import Logger
+
+try:
+    import vlc
+    VLC_AVAILABLE = True
+except ImportError:
+    VLC_AVAILABLE = False
+
+UNKNOWN_SIZE = 2 ** 64 - 1
+
+class GrowingFileSource:
+    """Nguồn media cho VLC đọc từ file đang được download (qua media_new_callbacks)"""
+    POLL_INTERVAL = 0.2  # chờ dữ liệu theo từng đoạn ngắn để close() có hiệu lực ngay
+
+    def __init__(self, job, wait_timeout=30.0):
+        self.job = job
+        self.wait_timeout = wait_timeout
+        self.offset = 0
+        self.closed = False
+
+        # Giữ tham chiếu tới các callback ctypes, nếu không sẽ bị GC khi VLC còn gọi
+        self._callbacks = (
+            vlc.CallbackDecorators.MediaOpenCb(self._open),
+            vlc.CallbackDecorators.MediaReadCb(self._read),
+            vlc.CallbackDecorators.MediaSeekCb(self._seek),
+            vlc.CallbackDecorators.MediaCloseCb(self._close),
+        )
+
+    def create_media(self, instance):
+        return instance.media_new_callbacks(*self._callbacks, None)
+
+    def current_path(self):
+        """File hiện tại: file trong cache khi đã xong, nếu không thì file .part"""
+        for path in (self.job.filepath, self.job.staged_path, self.job.partial_path):
+            if path and os.path.exists(path):
+                return path
+        return None
+
+    def read_at(self, offset, length):
+        """Đọc tối đa length byte tại offset, chờ nếu dữ liệu chưa tải tới"""
+        while not self.closed:
+            # Kiểm tra trước khi đọc: job đã xong mà đọc ra rỗng thì mới thật sự là EOF
+            finished = self.job.is_finished()
+            # Mở/đóng mỗi lần đọc để downloader vẫn rename được file (Windows)
+            path = self.current_path()
+            if path:
+                try:
+                    with open(path, 'rb') as f:
+                        f.seek(offset)
+                        data = f.read(length)
+                    if data:
+                        return data
+                except OSError:
+                    # File vừa bị rename sang chỗ khác, thử lại
+                    continue
+
+            if finished:
+                return b''
+            deadline = time.monotonic() + self.wait_timeout
+            while not self.job.wait_for_bytes(offset + 1, timeout=self.POLL_INTERVAL):
+                if self.closed:
+                    return b''
+                if time.monotonic() >= deadline:
+                    Logger.warning("GrowingFileSource: Hết thời gian chờ dữ liệu")
+                    return None
+        return b''
+
+    def close(self):
+        """Gọi từ luồng Kivy trước khi stop/đổi media: read đang chờ sẽ trả về EOF"""
+        self.closed = True
+
+    def _open(self, opaque, datap, sizep):
+        total = self.job.total_bytes
+        path = self.current_path()
+        if self.job.is_finished() and path:
+            total = os.path.getsize(path)
+        sizep.contents.value = total or UNKNOWN_SIZE
+        self.offset = 0
+        self.closed = False  # stop() rồi play() lại: VLC mở lại nguồn
+        return 0
+
+    def _read(self, opaque, buf, length):
+        data = self.read_at(self.offset, length)
+        if data is None:
+            return -1
+        ctypes.memmove(buf, data, len(data))
+        self.offset += len(data)
+        return len(data)
+
+    def _seek(self, opaque, offset):
+        self.offset = offset
+        return 0
+
+    def _close(self, opaque):
+        self.closed = True
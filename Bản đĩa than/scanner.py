@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+import settings
+from utils import AudioUtils
+
+try:
+    import mutagen
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+class LibraryScanner:
+    """Quét thư mục nhạc bằng pool luồng, chỉ đọc lại tag của file có mtime/size thay đổi"""
+    BATCH_SIZE = 500  # số track ghi vào SQLite mỗi transaction
+
+    def __init__(self, library, folders=None, workers=None):
+        self.library = library
+        self.folders = folders if folders is not None else settings.MUSIC_DIRS
+        self.workers = workers or settings.LIBRARY_SCAN_WORKERS
+        self.scanning = False
+        self.lock = threading.Lock()
+
+    def start(self, on_done=None):
+        """Quét ở nền; on_done(stats) được gọi trên luồng Kivy khi xong"""
+        with self.lock:
+            if self.scanning:
+                return False
+            self.scanning = True
+        threading.Thread(target=self._run, args=(on_done,), daemon=True).start()
+        return True
+
+    def _run(self, on_done):
+        stats = None
+        try:
+            stats = self.scan()
+        except Exception as e:
+            Logger.error(f"LibraryScanner: Lỗi quét thư viện - {e}")
+        finally:
+            self.scanning = False
+        if on_done:
+            Clock.schedule_once(lambda dt: on_done(stats), 0)
+
+    def scan(self):
+        """Quét tất cả thư mục, trả về số file tìm thấy / cập nhật / đã xóa"""
+        started = time.time()
+        roots = [os.path.abspath(folder) for folder in self.folders if os.path.isdir(folder)]
+        known = self.library.local_index()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scan') as executor:
+            found = self.walk(executor, roots)
+
+            # File mới hoặc đã sửa mới phải đọc tag
+            changed = [(path, stat) for path, stat in found.items() if known.get(path) != stat]
+            for start in range(0, len(changed), self.BATCH_SIZE):
+                batch = changed[start:start + self.BATCH_SIZE]
+                self.library.upsert_many(list(executor.map(lambda item: self.probe(*item), batch)))
+
+        # File đã bị xóa khỏi các thư mục được quét
+        removed = [
+            path for path in known
+            if path not in found and any(path.startswith(root + os.sep) for root in roots)
+        ]
+        self.library.remove_paths(removed)
+
+        stats = {'found': len(found), 'updated': len(changed), 'removed': len(removed)}
+        Logger.info(
+            f"LibraryScanner: {stats['found']} file, cập nhật {stats['updated']}, "
+            f"xóa {stats['removed']} ({time.time() - started:.1f}s)"
+        )
+        return stats
+
+    def walk(self, executor, roots):
+        """Duyệt cây thư mục song song: mỗi thư mục con là một task"""
+        found = {}  # path -> (size, mtime)
+        pending = {executor.submit(self.list_dir, root) for root in roots}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                found.update(files)
+                pending.update(executor.submit(self.list_dir, subdir) for subdir in subdirs)
+        return found
+
+    @staticmethod
+    def list_dir(path):
+        files = {}
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith('.'):
+                                subdirs.append(entry.path)
+                        elif entry.is_file() and AudioUtils.is_audio_file(entry.name):
+                            stat = entry.stat()
+                            files[entry.path] = (stat.st_size, stat.st_mtime)
+                    except OSError:
+                        continue
+        except OSError as e:
+            Logger.warning(f"LibraryScanner: Không đọc được {path} - {e}")
+        return files, subdirs
+
+    @staticmethod
+    def probe(path, stat):
+        """Đọc title/artist/duration (cần mutagen, không có thì lấy tên file)"""
+        size, mtime = stat
+        track = {
+            'local_path': path,
+            'title': os.path.splitext(os.path.basename(path))[0],
+            'artist': 'Local File',
+            'duration_s': None,
+            'size': size,
+            'mtime': mtime,
+        }
+        if not MUTAGEN_AVAILABLE:
+            return track
+
+        try:
+            audio = mutagen.File(path, easy=True)
+        except Exception as e:
+            Logger.debug(f"LibraryScanner: Không đọc được tag {path} - {e}")
+            return track
+        if audio is None:
+            return track
+
+        if audio.info and getattr(audio.info, 'length', None):
+            track['duration_s'] = audio.info.length
+        tags = audio.tags or {}
+        for field in ('title', 'artist'):
+            value = tags.get(field)
+            if value:
+                track[field] = value[0] if isinstance(value, list) else str(value)
+        return track
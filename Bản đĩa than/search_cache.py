@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from kivy.logger import Logger
+
+import settings
+
+# Chỉ lưu các field gốc của kết quả tìm kiếm (không lưu local_path, original_index...)
+TRACK_FIELDS = ('title', 'artist', 'duration', 'duration_s', 'url', 'platform')
+
+class SearchCache:
+    """Cache query đã chuẩn hóa -> danh sách track, trong bộ nhớ và trên đĩa (TTL + LRU)"""
+    def __init__(self, path=None, ttl=None, max_stale=None, max_entries=None):
+        self.path = path or settings.SEARCH_CACHE_PATH
+        self.ttl = ttl if ttl is not None else settings.SEARCH_CACHE_TTL
+        self.max_stale = max_stale if max_stale is not None else settings.SEARCH_CACHE_MAX_STALE
+        self.max_entries = max_entries or settings.SEARCH_CACHE_MAX_ENTRIES
+        self.entries = OrderedDict()  # query -> {'time': ..., 'tracks': [...]}
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def normalize(query):
+        return ' '.join(query.lower().split())
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            Logger.warning(f"SearchCache: File cache hỏng, bỏ qua - {e}")
+            return
+
+        now = time.time()
+        with self.lock:
+            for query, entry in sorted(data.items(), key=lambda item: item[1].get('time', 0)):
+                if now - entry.get('time', 0) <= self.max_stale:
+                    self.entries[query] = entry
+
+    def save(self):
+        with self.lock:
+            data = dict(self.entries)
+        tmp_path = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            Logger.error(f"SearchCache: Lỗi ghi cache - {e}")
+
+    def get(self, query):
+        """Trả về (tracks, stale); tracks là None nếu không có hoặc đã quá cũ"""
+        key = self.normalize(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, False
+
+            age = time.time() - entry['time']
+            if age > self.max_stale:
+                del self.entries[key]
+                return None, False
+
+            self.entries.move_to_end(key)
+            # Trả về bản sao để UI có thể sửa dict mà không làm bẩn cache
+            tracks = [dict(track) for track in entry['tracks']]
+            return tracks, age > self.ttl
+
+    def put(self, query, tracks):
+        key = self.normalize(query)
+        with self.lock:
+            self.entries[key] = {
+                'time': time.time(),
+                'tracks': [{field: track.get(field) for field in TRACK_FIELDS} for track in tracks],
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.save()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+
+# Thư mục dữ liệu của ứng dụng (cache, index...)
+APP_DATA_DIR = os.path.join(os.path.expanduser('~'), '.soundcloud_player')
+
+# Cache audio lâu dài, khóa theo id của SoundCloud
+CACHE_DIR = os.path.join(APP_DATA_DIR, 'cache')
+CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB
+
+# Số luồng download chạy song song
+DOWNLOAD_WORKERS = 3
+
+# Số bài tiếp theo trong queue được tải sẵn
+PREFETCH_DEPTH = 3
+
+# Phát trong khi đang tải: bắt đầu phát khi đã có đủ đoạn đầu
+PROGRESSIVE_PLAYBACK = True
+PROGRESSIVE_PREFIX_BYTES = 256 * 1024
+PROGRESSIVE_TIMEOUT = 30.0
+
+# Cache kết quả tìm kiếm: còn mới trong TTL, quá TTL vẫn hiển thị ngay rồi làm mới ở nền
+SEARCH_CACHE_PATH = os.path.join(APP_DATA_DIR, 'search_cache.json')
+SEARCH_CACHE_TTL = 10 * 60
+SEARCH_CACHE_MAX_STALE = 7 * 24 * 60 * 60
+SEARCH_CACHE_MAX_ENTRIES = 200
+
+# Thư viện track (SQLite)
+LIBRARY_DB_PATH = os.path.join(APP_DATA_DIR, 'library.db')
+
+# Thư mục nhạc local được quét vào thư viện khi khởi động
+MUSIC_DIRS = [os.path.join(os.path.expanduser('~'), 'Music')]
+LIBRARY_SCAN_WORKERS = 8
+
+# Số YoutubeDL giữ sẵn cho tìm kiếm (download dùng DOWNLOAD_WORKERS)
+YDL_SEARCH_POOL_SIZE = 2
+
+# Giới hạn băng thông download tổng (bytes/s). 0 = tự ước lượng từ tốc độ đo được,
+# chỉ chia phần khi có nhiều job chạy cùng lúc
+DOWNLOAD_MAX_RATE = 0
+
+# Crossfade giữa các bài trong queue (VLC): số giây chồng lên nhau, 0 = tắt (chỉ gapless)
+# Curve: 'linear', 'equal_power', 's_curve'
+CROSSFADE_SECONDS = 0
+CROSSFADE_CURVE = 'equal_power'
@@ -1,18 +1,81 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import numpy as np
 from kivy.uix.slider import Slider
-from kivy.graphics import Color, Rectangle, Ellipse
+from kivy.graphics import Color, Ellipse, RenderContext, Mesh
+from kivy.logger import Logger
 from kivy.metrics import dp
 
+# Tô màu theo vị trí: phần đã phát / chưa phát tách nhau ở uniform progress_x,
+# nên cập nhật tiến độ chỉ đổi một uniform, không dựng lại mesh
+# (opacity chỉ có trong header của vertex shader nên truyền sang fragment qua frag_color;
+# vertex shader ghi đủ các varying của header để link được cả với fragment shader mặc định)
+VERTEX_SHADER = '''
+$HEADER$
+varying float pos_x;
+
+void main(void) {
+    pos_x = vPosition.x;
+    frag_color = vec4(1.0, 1.0, 1.0, opacity);
+    tex_coord0 = vec2(0.0, 0.0);
+    gl_Position = projection_mat * modelview_mat * vec4(vPosition.xy, 0.0, 1.0);
+}
+'''
+
+FRAGMENT_SHADER = '''
+$HEADER$
+varying float pos_x;
+uniform float progress_x;
+uniform vec4 played_color;
+uniform vec4 remaining_color;
+
+void main(void) {
+    vec4 tint = pos_x < progress_x ? played_color : remaining_color;
+    gl_FragColor = tint * frag_color;
+}
+'''
+
 class ProgressSlider(Slider):
+    PLAYED_COLOR = [0.2, 0.7, 1.0, 1.0]
+    REMAINING_COLOR = [0.3, 0.3, 0.3, 1.0]
+    COLUMN_FILL = 0.7  # tỉ lệ bề rộng cột so với bước giữa hai cột
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.thumb_size = dp(20)
         self.track_height = dp(4)
-        self.bind(pos=self.update_graphics, size=self.update_graphics)
-        self.bind(value=self.update_graphics)
+        self.wave_height = dp(28)
+        self.peaks = None  # mảng (cột, 2) min/max trong -1..1, None thì vẽ thanh phẳng
+        
+        self.build_graphics()
+        self.bind(pos=self.update_mesh, size=self.update_mesh)
+        self.bind(value=self.update_graphics, min=self.update_graphics, max=self.update_graphics)
         
+    def build_graphics(self):
+        """Dựng một lần: mesh waveform trong RenderContext riêng, rồi tới thumb"""
+        self.canvas.clear()
+        self.wave_context = RenderContext(use_parent_projection=True, use_parent_modelview=True)
+        self.wave_context.shader.vs = VERTEX_SHADER
+        self.wave_context.shader.fs = FRAGMENT_SHADER
+        if not self.wave_context.shader.success:
+            Logger.error("ProgressSlider: Lỗi compile shader")
+        self.wave_context['played_color'] = self.PLAYED_COLOR
+        self.wave_context['remaining_color'] = self.REMAINING_COLOR
+        with self.wave_context:
+            self.mesh = Mesh(fmt=[(b'vPosition', 2, 'float')], mode='triangles')
+        self.canvas.add(self.wave_context)
+        
+        with self.canvas:
+            Color(1, 1, 1, 1)
+            self.thumb = Ellipse(size=(self.thumb_size, self.thumb_size))
+        self.update_mesh()
+    
+    def set_peaks(self, peaks):
+        """Đường bao của bài đang phát (None: quay về thanh phẳng)"""
+        self.peaks = peaks
+        self.update_mesh()
+    
     def get_norm_value(self):
         if self.max == self.min:
             return 0
@@ -25,35 +88,47 @@ class ProgressSlider(Slider):
         thumb_x = track_start_x + norm_value * track_width
         return thumb_x
     
-    def update_graphics(self, *args):
-        self.canvas.clear()
+    def update_mesh(self, *args):
+        """Chỉ chạy khi đổi kích thước/vị trí hoặc đổi bài"""
+        track_start_x = self.x + self.thumb_size / 2
+        track_width = max(self.width - self.thumb_size, 0)
         
-        with self.canvas:
-            Color(0.3, 0.3, 0.3, 1)
-            track_y = self.center_y - self.track_height / 2
-            Rectangle(
-                pos=(self.x + self.thumb_size / 2, track_y),
-                size=(self.width - self.thumb_size, self.track_height)
-            )
-            
-            Color(0.2, 0.7, 1, 1)
-            norm_value = self.get_norm_value()
-            progress_width = (self.width - self.thumb_size) * norm_value
-            
-            if progress_width > 0:
-                Rectangle(
-                    pos=(self.x + self.thumb_size / 2, track_y),
-                    size=(progress_width, self.track_height)
-                )
-            
-            Color(1, 1, 1, 1)
-            thumb_x = self.get_thumb_x()
-            thumb_y = self.center_y - self.thumb_size / 2
-            
-            Ellipse(
-                pos=(thumb_x - self.thumb_size / 2, thumb_y),
-                size=(self.thumb_size, self.thumb_size)
-            )
+        if self.peaks is None or not len(self.peaks):
+            left = np.array([track_start_x], dtype=np.float32)
+            right = left + track_width
+            low = np.array([-self.track_height / 2], dtype=np.float32)
+            high = -low
+        else:
+            count = len(self.peaks)
+            step = track_width / count
+            left = track_start_x + np.arange(count, dtype=np.float32) * step
+            right = left + max(step * self.COLUMN_FILL, 1.0)
+            # Đoạn lặng vẫn giữ tối thiểu bề dày của thanh phẳng
+            half = self.wave_height / 2
+            center = (self.peaks[:, 0] + self.peaks[:, 1]) * half / 2
+            low = np.minimum(self.peaks[:, 0] * half, center - self.track_height / 2)
+            high = np.maximum(self.peaks[:, 1] * half, center + self.track_height / 2)
+        
+        bottom = self.center_y + low
+        top = self.center_y + high
+        vertices = np.stack((
+            np.stack((left, bottom), axis=1),
+            np.stack((right, bottom), axis=1),
+            np.stack((right, top), axis=1),
+            np.stack((left, top), axis=1),
+        ), axis=1).astype(np.float32)
+        
+        quad = np.array([0, 1, 2, 2, 3, 0])
+        indices = (np.arange(len(left))[:, None] * 4 + quad).ravel()
+        self.mesh.vertices = vertices.ravel().tolist()
+        self.mesh.indices = indices.tolist()
+        self.update_graphics()
+    
+    def update_graphics(self, *args):
+        """Mỗi lần đổi value: chỉ đổi uniform tô màu và vị trí thumb"""
+        thumb_x = self.get_thumb_x()
+        self.wave_context['progress_x'] = float(thumb_x)
+        self.thumb.pos = (thumb_x - self.thumb_size / 2, self.center_y - self.thumb_size / 2)
     
     def on_touch_down(self, touch):
         if self.collide_point(*touch.pos):
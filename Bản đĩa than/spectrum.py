@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from kivy.logger import Logger
+
+from transcode import sidecar_path
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SIDECAR_SUFFIX = '.spectrum.npy'
+
+class SpectrumAnalyzer:
+    """Phổ của bài đang phát cho visualizer: đọc sidecar tính sẵn lúc download (memmap),
+    chưa có thì giải mã PCM bằng ffmpeg và tính FFT ở luồng nền"""
+    SAMPLE_RATE = 22050
+    FFT_SIZE = 2048
+    HOP = 512            # ~23 ms mỗi khung
+    MIN_FREQ = 40.0
+    MAX_FREQ = 11000.0
+    FLOOR_DB = -70.0     # mức dBFS ứng với cột thấp nhất
+    MAX_LEVEL = 1.5      # giá trị cột cao nhất; sidecar lưu uint8 0..255 trên thang này
+    READ_BYTES = 22050 * 2  # đọc ~1 giây PCM mỗi lần
+
+    def __init__(self, bar_count, ffmpeg_path=None, cache_dir=None):
+        self.bar_count = bar_count
+        self.ffmpeg = ffmpeg_path or shutil.which('ffmpeg')
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self.path = None
+        self.frames = []     # list mảng float (giải mã trực tiếp) hoặc memmap uint8 (sidecar)
+        self.quantized = False
+        self.generation = 0
+        self.process = None
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='spectrum')
+        self.pending = {}    # path -> future của sidecar đang tính ở nền
+
+        if NUMPY_AVAILABLE:
+            self.window = np.hanning(self.FFT_SIZE).astype(np.float32)
+            self.band_edges = self.make_band_edges(bar_count)
+
+    def available(self):
+        return NUMPY_AVAILABLE and self.ffmpeg is not None
+
+    @staticmethod
+    def sidecar_path(path):
+        return sidecar_path(path, SIDECAR_SUFFIX)
+
+    def make_band_edges(self, bar_count):
+        """Biên các dải tần chia theo thang log, quy ra chỉ số bin FFT (tăng dần, mỗi dải ít nhất 1 bin)"""
+        bin_count = self.FFT_SIZE // 2 + 1
+        hz = np.geomspace(self.MIN_FREQ, self.MAX_FREQ, bar_count + 1)
+        edges = np.round(hz * self.FFT_SIZE / self.SAMPLE_RATE).astype(np.int64)
+        steps = np.arange(bar_count + 1)
+        edges = np.maximum.accumulate(edges - steps) + steps
+        return np.clip(edges, 1, bin_count - 1)
+
+    def load(self, path):
+        """Chuyển sang file mới: dùng sidecar nếu có, không thì giải mã trực tiếp"""
+        if path == self.path:
+            return
+        self.stop()
+        self.path = path
+        if not NUMPY_AVAILABLE or not path or not os.path.exists(path):
+            return
+
+        frames = self.open_sidecar(path)
+        if frames is not None:
+            with self.lock:
+                self.frames = frames
+                self.quantized = True
+            return
+        with self.lock:
+            building = path in self.pending
+        if building:
+            # Post-processor đang tính sidecar cho file này: chờ _on_built thay vì giải mã lần thứ hai
+            return
+        if self.available():
+            threading.Thread(target=self._decode_live, args=(path, self.generation), daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            self.generation += 1
+            self.frames = []
+            self.quantized = False
+            self.path = None
+            process, self.process = self.process, None
+        if process:
+            process.kill()
+
+    def shutdown(self):
+        self.stop()
+        self.executor.shutdown(wait=False)
+
+    def get_bars(self, seconds):
+        """Phổ tại thời điểm phát seconds; None nếu chưa có dữ liệu tới đó"""
+        index = int((seconds * self.SAMPLE_RATE - self.FFT_SIZE / 2) / self.HOP)
+        frames = self.frames
+        if not len(frames) or index >= len(frames):
+            return None
+        frame = frames[max(index, 0)]
+        if self.quantized:
+            return frame * (self.MAX_LEVEL / 255.0)
+        return frame
+
+    def open_sidecar(self, path):
+        sidecar = self.sidecar_path(path)
+        if not os.path.exists(sidecar):
+            return None
+        try:
+            frames = np.load(sidecar, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            Logger.warning(f"SpectrumAnalyzer: Sidecar hỏng {os.path.basename(sidecar)} - {e}")
+            return None
+        if frames.ndim != 2 or frames.shape[1] != self.bar_count or frames.dtype != np.uint8:
+            return None
+        return frames
+
+    def on_track_cached(self, path):
+        """Post-processor của DownloadManager: tính sidecar ở nền sau mỗi lần tải xong"""
+        if not self.available() or os.path.exists(self.sidecar_path(path)):
+            return
+        with self.lock:
+            if path in self.pending:
+                return
+            future = self.executor.submit(self.build_sidecar, path)
+            self.pending[path] = future
+        # Đăng ký ngoài lock: future đã xong thì callback chạy ngay trên luồng này
+        future.add_done_callback(lambda f, path=path: self._on_built(path))
+
+    def _on_built(self, path):
+        """Sidecar vừa tính xong: nếu đang phát đúng bài này thì chuyển sang đọc sidecar"""
+        with self.lock:
+            self.pending.pop(path, None)
+            if path != self.path:
+                return
+        frames = self.open_sidecar(path)
+        with self.lock:
+            if frames is None or path != self.path:
+                return
+            self.generation += 1  # dừng giải mã trực tiếp nếu đang chạy
+            process, self.process = self.process, None
+            self.frames = frames
+            self.quantized = True
+        if process:
+            process.kill()
+
+    def build_sidecar(self, path):
+        try:
+            frames = list(self.iter_frames(path, lambda: True))
+        except (OSError, RuntimeError, ValueError) as e:
+            Logger.error(f"SpectrumAnalyzer: Lỗi phân tích {os.path.basename(path)} - {e}")
+            return
+        if frames:
+            self.save_sidecar(path, np.concatenate(frames))
+
+    def save_sidecar(self, path, frames):
+        sidecar = self.sidecar_path(path)
+        quantized = np.round(np.asarray(frames) * (255.0 / self.MAX_LEVEL)).astype(np.uint8)
+        # Tên tạm riêng cho mỗi lần ghi; prefix <key>. để evict cũng xóa luôn file tạm còn sót
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=os.path.basename(sidecar) + '.', suffix='.tmp', dir=os.path.dirname(sidecar)
+            )
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, quantized)
+            os.replace(tmp_path, sidecar)
+        except OSError as e:
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            Logger.error(f"SpectrumAnalyzer: Lỗi ghi sidecar {os.path.basename(sidecar)} - {e}")
+            return
+        Logger.info(f"SpectrumAnalyzer: Đã lưu {os.path.basename(sidecar)} ({len(quantized)} khung)")
+
+    def analyze(self, samples, count):
+        """count khung liên tiếp (cách nhau HOP mẫu) -> mảng (count, bar_count)"""
+        offsets = np.arange(count)[:, None] * self.HOP + np.arange(self.FFT_SIZE)[None, :]
+        spectrum = np.abs(np.fft.rfft(samples[offsets] * self.window, axis=1))
+        # Sóng sin full-scale qua cửa sổ Hann cho biên độ ~FFT_SIZE/4
+        power = (spectrum[:, :self.band_edges[-1]] / (self.FFT_SIZE / 4)) ** 2
+        # Lấy đỉnh trong mỗi dải: dải cao rất rộng, lấy trung bình sẽ làm mất các nốt đơn
+        bands = np.maximum.reduceat(power, self.band_edges[:-1], axis=1)
+        db = 10 * np.log10(bands + 1e-12)
+        return np.clip((db - self.FLOOR_DB) / -self.FLOOR_DB, 0.05, self.MAX_LEVEL).astype(np.float32)
+
+    def iter_frames(self, path, keep_going, on_process=None):
+        """Giải mã file bằng ffmpeg, trả về từng khối khung phổ (mỗi khối ~1 giây).
+        ffmpeg lỗi giữa chừng thì raise RuntimeError, để không lưu phổ bị cụt"""
+        cmd = [
+            self.ffmpeg, '-v', 'error', '-i', path,
+            '-vn', '-ac', '1', '-ar', str(self.SAMPLE_RATE), '-f', 's16le', '-',
+        ]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if on_process:
+            on_process(process)
+
+        pending = b''
+        samples = np.zeros(0, dtype=np.float32)
+        try:
+            while keep_going():
+                data = process.stdout.read(self.READ_BYTES)
+                if not data:
+                    break
+                # Pipe có thể trả về số byte lẻ: giữ lại byte thừa cho lần sau
+                data = pending + data
+                usable = len(data) - len(data) % 2
+                pending = data[usable:]
+                chunk = np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+                samples = np.concatenate((samples, chunk))
+
+                count = (len(samples) - self.FFT_SIZE) // self.HOP + 1
+                if count <= 0:
+                    continue
+                yield self.analyze(samples, count)
+                samples = samples[count * self.HOP:]
+            if keep_going() and process.wait() != 0:
+                raise RuntimeError(f"ffmpeg thoát với mã {process.returncode}")
+        finally:
+            process.kill()
+            process.stdout.close()
+            process.wait()
+
+    def _decode_live(self, path, generation):
+        def attach(process):
+            with self.lock:
+                if generation == self.generation:
+                    self.process = process
+                else:
+                    process.kill()
+
+        try:
+            for block in self.iter_frames(path, lambda: generation == self.generation, attach):
+                with self.lock:
+                    if generation != self.generation:
+                        return
+                    self.frames.extend(block)
+        except (OSError, RuntimeError, ValueError) as e:
+            Logger.error(f"SpectrumAnalyzer: Lỗi phân tích {os.path.basename(path)} - {e}")
+            return
+        finished = generation == self.generation
+
+        # Bài trong cache mà chưa có sidecar (tải từ trước): giải mã xong thì lưu luôn
+        if not finished or not self.frames or not self.in_cache(path):
+            return
+        with self.lock:
+            building = path in self.pending
+        if not building and not os.path.exists(self.sidecar_path(path)):
+            self.save_sidecar(path, np.array(self.frames))
+
+    def in_cache(self, path):
+        return self.cache_dir is not None and os.path.abspath(path).startswith(self.cache_dir + os.sep)
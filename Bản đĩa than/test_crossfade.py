@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Kiểm tra Crossfader với clock và backend giả: thời điểm bắt đầu fade, gain theo từng curve,
+cancel() liên tục không làm chồng nhiều fade
+
+Chạy: python -m unittest test_crossfade
+"""
+
+import math
+import unittest
+
+from crossfade import Crossfader, CURVES
+
+class FakeEvent:
+    def __init__(self, callback, due, interval=None):
+        self.callback = callback
+        self.due = due
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class FakeClock:
+    """Thay cho kivy Clock: thời gian chỉ chạy khi gọi advance()"""
+    def __init__(self):
+        self.now = 0.0
+        self.events = []
+
+    def schedule_once(self, callback, timeout=0):
+        event = FakeEvent(callback, self.now + timeout)
+        self.events.append(event)
+        return event
+
+    def schedule_interval(self, callback, interval):
+        event = FakeEvent(callback, self.now + interval, interval)
+        self.events.append(event)
+        return event
+
+    def active_intervals(self):
+        return [e for e in self.events if e.interval is not None and not e.cancelled]
+
+    def advance(self, seconds, step=0.01):
+        end = self.now + seconds
+        while self.now < end - 1e-9:
+            self.now = min(self.now + step, end)
+            for event in [e for e in self.events if not e.cancelled and e.due <= self.now + 1e-9]:
+                if event.interval is None:
+                    event.cancelled = True
+                    event.callback(self.now)
+                elif event.callback(event.interval) is False:
+                    event.cancelled = True
+                else:
+                    event.due += event.interval
+            self.events = [e for e in self.events if not e.cancelled]
+
+class FakePlayer:
+    """Chỉ những gì Crossfader dùng: get_time/get_length (ms), audio_set_volume, set_pause, stop"""
+    def __init__(self, clock, name, length=10.0):
+        self.clock = clock
+        self.name = name
+        self.length = length
+        self.started_at = None
+        self.volume = 100
+        self.stopped = 0
+
+    def play(self):
+        self.started_at = self.clock.now
+
+    def get_time(self):
+        if self.started_at is None:
+            return 0
+        return int((self.clock.now - self.started_at) * 1000)
+
+    def get_length(self):
+        return int(self.length * 1000)
+
+    def audio_set_volume(self, volume):
+        self.volume = volume
+
+    def set_pause(self, paused):
+        if not paused and self.started_at is None:
+            self.play()
+
+    def stop(self):
+        self.stopped += 1
+        self.started_at = None
+
+class FakeBackend:
+    """Giống AudioBackend ở phần hai player: player / next_player / next_file"""
+    def __init__(self, clock):
+        self.clock = clock
+        self.volume = 1.0
+        self.player = FakePlayer(clock, 'a')
+        self.next_player = FakePlayer(clock, 'b')
+        self.current_file = 'a.mp3'
+        self.next_file = None
+        self.advances = 0
+        self.preloaded = []
+
+    def preload_next(self, path):
+        self.preloaded.append(path)
+        self.next_file = path
+        self.next_player.started_at = None
+
+    def swap_to_next(self):
+        old_player = self.player
+        self.player, self.next_player = self.next_player, old_player
+        self.current_file, self.next_file = self.next_file, None
+        return old_player
+
+    def notify_advance(self):
+        self.advances += 1
+
+class CrossfaderTest(unittest.TestCase):
+    def make(self, duration=2.0, curve='equal_power'):
+        self.clock = FakeClock()
+        self.backend = FakeBackend(self.clock)
+        self.backend.player.play()
+        self.backend.preload_next('b.mp3')
+        return Crossfader(self.backend, duration=duration, curve=curve, clock=self.clock)
+
+    def test_fade_starts_duration_before_end(self):
+        fader = self.make(duration=2.0)
+        fader.arm()
+        self.clock.advance(7.9)
+        self.assertFalse(fader.is_fading())
+        self.assertEqual(self.backend.advances, 0)
+
+        self.clock.advance(0.2)
+        self.assertTrue(fader.is_fading())
+        self.assertEqual(self.backend.advances, 1)
+        self.assertEqual(self.backend.current_file, 'b.mp3')
+        self.assertIsNotNone(self.backend.player.started_at)
+
+    def test_fade_starts_immediately_when_seeking_past_start_point(self):
+        fader = self.make(duration=2.0)
+        self.backend.player.started_at = -9.0  # đang ở giây thứ 9 của bài dài 10 giây
+        fader.arm()
+        self.assertTrue(fader.is_fading())
+
+    def test_no_fade_without_next_track(self):
+        fader = self.make(duration=2.0)
+        self.backend.next_file = None
+        fader.arm()
+        self.clock.advance(10.0)
+        self.assertFalse(fader.is_fading())
+
+    def test_curve_gains(self):
+        for name, curve in CURVES.items():
+            with self.subTest(curve=name):
+                self.assertEqual(curve(0.0), (1.0, 0.0))
+                out_gain, in_gain = curve(1.0)
+                self.assertAlmostEqual(out_gain, 0.0)
+                self.assertAlmostEqual(in_gain, 1.0)
+        self.assertEqual(CURVES['linear'](0.5), (0.5, 0.5))
+        self.assertEqual(CURVES['s_curve'](0.5), (0.5, 0.5))
+        half = math.sqrt(0.5)
+        out_gain, in_gain = CURVES['equal_power'](0.5)
+        self.assertAlmostEqual(out_gain, half)
+        self.assertAlmostEqual(in_gain, half)
+        # equal_power giữ tổng công suất ở mọi thời điểm
+        for t in (0.1, 0.3, 0.7, 0.9):
+            out_gain, in_gain = CURVES['equal_power'](t)
+            self.assertAlmostEqual(out_gain ** 2 + in_gain ** 2, 1.0)
+
+    def test_volumes_follow_curve_on_audio_clock(self):
+        for name, curve in CURVES.items():
+            with self.subTest(curve=name):
+                fader = self.make(duration=2.0, curve=name)
+                fader.start()
+                outgoing, incoming = fader.outgoing, fader.incoming
+                self.assertEqual(incoming.volume, 0)
+
+                for t in (0.0, 0.5):
+                    incoming.started_at = self.clock.now - t * fader.duration
+                    fader.tick(fader.TICK)
+                    out_gain, in_gain = curve(t)
+                    self.assertEqual(outgoing.volume, int(100 * out_gain))
+                    self.assertEqual(incoming.volume, int(100 * in_gain))
+
+                incoming.started_at = self.clock.now - fader.duration
+                self.assertFalse(fader.tick(fader.TICK))
+                self.assertFalse(fader.is_fading())
+                self.assertEqual(outgoing.stopped, 1)
+                self.assertEqual(incoming.volume, 100)
+
+    def test_fade_finishes_after_duration(self):
+        fader = self.make(duration=2.0)
+        fader.start()
+        outgoing = fader.outgoing
+        self.clock.advance(1.9)
+        self.assertTrue(fader.is_fading())
+        self.clock.advance(0.2)
+        self.assertFalse(fader.is_fading())
+        self.assertEqual(outgoing.stopped, 1)
+        self.assertEqual(self.clock.active_intervals(), [])
+
+    def test_repeated_cancel_never_stacks_fades(self):
+        fader = self.make(duration=2.0)
+        fader.start()
+        outgoing = fader.outgoing
+        self.assertEqual(len(self.clock.active_intervals()), 1)
+
+        for _ in range(5):
+            fader.cancel()
+            fader.arm()
+        self.assertFalse(fader.is_fading())
+        self.assertEqual(self.clock.active_intervals(), [])
+        self.assertEqual(outgoing.stopped, 1)
+
+        # Nạp bài mới rồi bấm next liên tục: mỗi lần chỉ có tối đa một fade
+        for i in range(5):
+            self.backend.preload_next(f'c{i}.mp3')
+            self.backend.player.started_at = self.clock.now - 9.0
+            fader.arm()
+            self.assertTrue(fader.is_fading())
+            fader.cancel()
+            fader.cancel()
+            self.assertLessEqual(len(self.clock.active_intervals()), 1)
+        self.assertEqual(self.clock.active_intervals(), [])
+        self.clock.advance(5.0)
+        self.assertFalse(fader.is_fading())
+
+    def test_preload_during_fade_waits_for_finish(self):
+        fader = self.make(duration=2.0)
+        fader.start()
+        fader.pending_next = 'c.mp3'
+        self.clock.advance(2.1)
+        self.assertEqual(self.backend.preloaded[-1], 'c.mp3')
+        self.assertEqual(self.backend.next_file, 'c.mp3')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from kivy.logger import Logger
+
+# Định dạng pygame.mixer.music đọc trực tiếp được
+PYGAME_NATIVE_EXTENSIONS = ('.wav', '.mp3', '.ogg')
+CONVERTED_SUFFIX = '.pygame.ogg'
+
+def sidecar_path(path, suffix):
+    """<key><suffix> cạnh file trong cache; bản convert cho pygame dùng chung sidecar với file gốc"""
+    if path.endswith(CONVERTED_SUFFIX):
+        return path[:-len(CONVERTED_SUFFIX)] + suffix
+    return os.path.splitext(path)[0] + suffix
+
+class Transcoder:
+    """Chuyển file đã cache sang OGG Vorbis một lần ở nền, lưu cạnh file gốc"""
+    def __init__(self, ffmpeg_path=None):
+        self.ffmpeg = ffmpeg_path or shutil.which('ffmpeg')
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='transcode')
+        self.pending = {}  # path -> future
+        self.lock = threading.Lock()
+
+    def available(self):
+        return self.ffmpeg is not None
+
+    @staticmethod
+    def target_path(path):
+        return os.path.splitext(path)[0] + CONVERTED_SUFFIX
+
+    @staticmethod
+    def needs_transcode(path):
+        return os.path.splitext(path)[1].lower() not in PYGAME_NATIVE_EXTENSIONS
+
+    def get_playable(self, path):
+        """Đường dẫn pygame phát được: file gốc, hoặc file đã convert sẵn (None nếu chưa có)"""
+        if not self.needs_transcode(path):
+            return path
+        target = self.target_path(path)
+        return target if os.path.exists(target) else None
+
+    def submit(self, path):
+        """Đưa file vào hàng đợi convert ở nền (bỏ qua nếu không cần hoặc đã có)"""
+        if not self.available() or self.get_playable(path):
+            return None
+        with self.lock:
+            future = self.pending.get(path)
+            if future is not None:
+                return future
+            future = self.executor.submit(self._convert, path)
+            self.pending[path] = future
+        # Đăng ký ngoài lock: future đã xong thì _forget chạy ngay trên luồng này và cần lấy lock
+        future.add_done_callback(lambda f, path=path: self._forget(path))
+        return future
+
+    def convert(self, path):
+        """Convert ngay (chờ kết quả); dùng khi phát mà nền chưa convert xong"""
+        playable = self.get_playable(path)
+        if playable:
+            return playable
+        future = self.submit(path)
+        if future is None:
+            raise RuntimeError("Cần ffmpeg để phát định dạng này với pygame")
+        return future.result()
+
+    def _forget(self, path):
+        with self.lock:
+            self.pending.pop(path, None)
+
+    def _convert(self, path):
+        target = self.target_path(path)
+        tmp_path = target + '.tmp.ogg'
+        cmd = [
+            self.ffmpeg, '-v', 'error', '-y', '-i', path,
+            '-vn', '-c:a', 'libvorbis', '-q:a', '5', '-ar', '44100', '-ac', '2',
+            tmp_path,
+        ]
+        try:
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            os.replace(tmp_path, target)
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, 'stderr', b'') or b''
+            Logger.error(f"Transcoder: Lỗi convert {path} - {e} {stderr.decode(errors='ignore')[:200]}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        Logger.info(f"Transcoder: Đã convert {os.path.basename(path)} -> {os.path.basename(target)}")
+        return target
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
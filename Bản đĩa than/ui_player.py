@@ -16,6 +16,7 @@ class PlayerScreen(Screen):
     def __init__(self, app=None, **kwargs):
         super().__init__(**kwargs)
         self.app = app
+        self.waveform_path = None
         
         main_layout = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10))
         
@@ -134,7 +135,8 @@ class PlayerScreen(Screen):
 
     def on_progress_seek(self, instance, touch):
         """Xử lý khi người dùng seek"""
-        if instance.max > 0:
+        # Chưa biết duration thì max của slider chưa đúng với bài này
+        if instance.max > 0 and self.app.audio_backend.get_duration() > 0:
             position = instance.value / instance.max
             if self.app.audio_backend.backend == "vlc":
                 self.app.set_position(position)
@@ -157,6 +159,19 @@ class PlayerScreen(Screen):
             if duration > 0:
                 self.duration_label.text = self.format_time(duration)
                 self.progress_slider.max = duration
+            else:
+                # Chưa parse xong: không giữ độ dài của bài trước (on_duration_changed sẽ cập nhật)
+                self.duration_label.text = '--:--'
+            
+            self.load_waveform(self.app.audio_backend.current_file)
+    
+    def load_waveform(self, path):
+        """Đổi bài: về thanh phẳng, peaks (đọc sidecar hoặc tính ở nền) có thì vẽ lên slider"""
+        if path == self.waveform_path:
+            return
+        self.waveform_path = path
+        self.progress_slider.set_peaks(None)
+        self.app.waveform.load(path, self.progress_slider.set_peaks)
     
     def update_play_button(self):
         if self.app.is_playing:
@@ -195,6 +210,7 @@ class PlayerScreen(Screen):
             self.app.repeat_mode = 0
         else:
             self.app.repeat_mode = 1
+        self.app.preload_next_track()
         self.update_repeat_button()
     
     def update_repeat_button(self):
@@ -14,23 +14,43 @@ from kivy.uix.widget import Widget
 from kivy.uix.popup import Popup
 from kivy.uix.filechooser import FileChooserListView
 from kivy.uix.scrollview import ScrollView
-from kivy.graphics import Color, Rectangle, Line, Ellipse
+from kivy.graphics import Color, Rectangle, Line, Ellipse, PushMatrix, PopMatrix, Rotate
 from kivy.graphics.instructions import InstructionGroup
 from kivy.core.text import Label as CoreLabel
 from kivy.metrics import dp
 from kivy.clock import Clock
 from ui_base import GradientButton
+from downloader import DownloadJob, PRIORITY_BACKGROUND
+from search_cache import SearchCache
+from utils import AudioUtils
 import threading
+import itertools
 import os
-import yt_dlp
+from collections import OrderedDict
 
 class VinylDiscWidget(Widget):
+    # Rendered number textures, shared by all discs: (text, font_size) -> texture (LRU)
+    LABEL_CACHE_SIZE = 128
+    label_textures = OrderedDict()
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.selected_tracks = []  # Only tracks added to disc
         self.track_positions = []
         self.rotation_angle = 0
         self.callback = None
+        self.downloaded_state = ()
+        
+        # Static disc is built once per size change; markers sit under one Rotate,
+        # so a rotation frame only changes a single angle
+        self.disc_layer = InstructionGroup()
+        self.marker_layer = InstructionGroup()
+        with self.canvas:
+            self.canvas.add(self.disc_layer)
+            PushMatrix()
+            self.rotation = Rotate(angle=0, origin=self.center)
+            self.canvas.add(self.marker_layer)
+            PopMatrix()
         
         self.bind(size=self.update_graphics, pos=self.update_graphics)
         
@@ -50,25 +70,24 @@ class VinylDiscWidget(Widget):
         
         self.selected_tracks.append(track_info)
         print(f"Track added. New disc size: {len(self.selected_tracks)}")
-        self.calculate_positions()
-        self.update_graphics()
+        self.update_markers()
         
     def remove_track_from_disc(self, track_info):
         """Remove a track from disc"""
         self.selected_tracks = [t for t in self.selected_tracks if t.get('url') != track_info.get('url')]
-        self.calculate_positions()
-        self.update_graphics()
+        self.update_markers()
         
     def clear_disc(self):
         """Clear all tracks from disc"""
         self.selected_tracks = []
         self.track_positions = []
-        self.update_graphics()
+        self.update_markers()
         
     def set_callback(self, callback):
         self.callback = callback
     
     def calculate_positions(self):
+        """Marker positions in the current (rotated) frame, used for hit testing"""
         if not self.selected_tracks:
             self.track_positions = []
             return
@@ -105,97 +124,127 @@ class VinylDiscWidget(Widget):
         self.rotation_angle += 1
         if self.rotation_angle >= 360:
             self.rotation_angle = 0
-        self.calculate_positions()
-        self.update_graphics()
+        self.rotation.angle = self.rotation_angle
+        
+        # Markers turn green once their download finishes
+        downloaded = tuple(t.get('local_path') is not None for t in self.selected_tracks)
+        if downloaded != self.downloaded_state:
+            self.update_markers()
     
     def update_graphics(self, *args):
+        """Rebuild both layers (size or position changed)"""
         if self.size[0] <= 0 or self.size[1] <= 0:
             return
-            
-        self.canvas.clear()
+        self.rotation.origin = self.center
+        self.build_disc()
+        self.update_markers()
+    
+    def build_disc(self):
+        self.disc_layer.clear()
+        
+        # Main disc background
+        disc_radius = min(self.width, self.height) * 0.4
+        self.disc_layer.add(Color(0.05, 0.05, 0.05, 1))
+        self.disc_layer.add(Ellipse(
+            pos=(self.center_x - disc_radius, self.center_y - disc_radius),
+            size=(disc_radius * 2, disc_radius * 2)
+        ))
+        
+        # Groove lines
+        self.disc_layer.add(Color(0.1, 0.1, 0.1, 1))
+        for i in range(5):
+            groove_radius = disc_radius * 0.3 + i * (disc_radius * 0.15)
+            self.disc_layer.add(Line(circle=(self.center_x, self.center_y, groove_radius), width=1))
+        
+        # Center label
+        center_radius = disc_radius * 0.2
+        self.disc_layer.add(Color(0.2, 0.2, 0.2, 1))
+        self.disc_layer.add(Ellipse(
+            pos=(self.center_x - center_radius, self.center_y - center_radius),
+            size=(center_radius * 2, center_radius * 2)
+        ))
+        
+        # Center hole
+        hole_radius = dp(8)
+        self.disc_layer.add(Color(0.0, 0.0, 0.0, 1))
+        self.disc_layer.add(Ellipse(
+            pos=(self.center_x - hole_radius, self.center_y - hole_radius),
+            size=(hole_radius * 2, hole_radius * 2)
+        ))
+    
+    def update_markers(self):
+        """Rebuild the track markers at rotation 0; the Rotate instruction turns them"""
+        self.marker_layer.clear()
+        self.downloaded_state = tuple(t.get('local_path') is not None for t in self.selected_tracks)
+        if not self.selected_tracks or self.size[0] <= 0 or self.size[1] <= 0:
+            return
         
-        with self.canvas:
-            # Main disc background
-            Color(0.05, 0.05, 0.05, 1)
-            disc_radius = min(self.width, self.height) * 0.4
-            Ellipse(
-                pos=(self.center_x - disc_radius, self.center_y - disc_radius),
-                size=(disc_radius * 2, disc_radius * 2)
-            )
+        radius = min(self.width, self.height) * 0.25
+        angle_step = 360.0 / len(self.selected_tracks)
+        track_radius = dp(25)
+        inner_radius = track_radius * 0.5
+        
+        positions = []
+        for i, track in enumerate(self.selected_tracks):
+            angle = math.radians(i * angle_step - 90)
+            x = self.center_x + math.cos(angle) * radius
+            y = self.center_y + math.sin(angle) * radius
+            positions.append((x, y, track.get('original_index', i + 1)))
             
-            # Groove lines
-            Color(0.1, 0.1, 0.1, 1)
-            for i in range(5):
-                groove_radius = disc_radius * 0.3 + i * (disc_radius * 0.15)
-                Line(circle=(self.center_x, self.center_y, groove_radius), width=1)
+            # Track color
+            if track.get('local_path') is not None:
+                self.marker_layer.add(Color(0.1, 0.8, 0.3, 0.9))
+            else:
+                self.marker_layer.add(Color(0.2, 0.6, 1.0, 0.9))
             
-            # Center label
-            Color(0.2, 0.2, 0.2, 1)
-            center_radius = disc_radius * 0.2
-            Ellipse(
-                pos=(self.center_x - center_radius, self.center_y - center_radius),
-                size=(center_radius * 2, center_radius * 2)
-            )
+            # Main track circle
+            self.marker_layer.add(Ellipse(
+                pos=(x - track_radius, y - track_radius),
+                size=(track_radius * 2, track_radius * 2)
+            ))
             
-            # Center hole
-            Color(0.0, 0.0, 0.0, 1)
-            hole_radius = dp(8)
-            Ellipse(
-                pos=(self.center_x - hole_radius, self.center_y - hole_radius),
-                size=(hole_radius * 2, hole_radius * 2)
-            )
+            # Inner circle for vinyl look
+            self.marker_layer.add(Color(0.1, 0.1, 0.1, 1))
+            self.marker_layer.add(Ellipse(
+                pos=(x - inner_radius, y - inner_radius),
+                size=(inner_radius * 2, inner_radius * 2)
+            ))
+        
+        # Draw numbers on top (separate loop to ensure they're visible)
+        self.marker_layer.add(Color(1, 1, 1, 1))
+        for x, y, number in positions:
+            texture = self.get_label_texture(str(number), dp(14))
             
-            # Draw tracks with numbers
-            track_radius = dp(25)
-            for i, pos_data in enumerate(self.track_positions):
-                x, y = pos_data['x'], pos_data['y']
-                downloaded = pos_data['downloaded']
-                number = pos_data['number']
-                
-                # Track color
-                if downloaded:
-                    Color(0.1, 0.8, 0.3, 0.9)
-                else:
-                    Color(0.2, 0.6, 1.0, 0.9)
-                
-                # Main track circle
-                Ellipse(
-                    pos=(x - track_radius, y - track_radius),
-                    size=(track_radius * 2, track_radius * 2)
-                )
-                
-                # Inner circle for vinyl look
-                Color(0.1, 0.1, 0.1, 1)
-                inner_radius = track_radius * 0.5
-                Ellipse(
-                    pos=(x - inner_radius, y - inner_radius),
-                    size=(inner_radius * 2, inner_radius * 2)
-                )
-                
-
-            
-            # Draw numbers on top (separate loop to ensure they're visible)
-            for i, pos_data in enumerate(self.track_positions):
-                x, y = pos_data['x'], pos_data['y']
-                number = pos_data['number']
-                
-                # Create text label
-                label = CoreLabel(text=str(number), font_size=dp(14), color=(1, 1, 1, 1))
-                label.refresh()
-                texture = label.texture
-                
-                # Position text in center of circle
-                text_x = x - texture.width / 2
-                text_y = y - texture.height / 2
-                
-                Color(1, 1, 1, 1)
-                Rectangle(texture=texture, pos=(text_x, text_y), size=texture.size)
+            # Position text in center of circle
+            self.marker_layer.add(Rectangle(
+                texture=texture,
+                pos=(x - texture.width / 2, y - texture.height / 2),
+                size=texture.size
+            ))
+    
+    @classmethod
+    def get_label_texture(cls, text, font_size):
+        """Text layout and GPU upload happen once per (text, font_size), then the texture is reused"""
+        key = (text, font_size)
+        texture = cls.label_textures.get(key)
+        if texture is not None:
+            cls.label_textures.move_to_end(key)
+            return texture
+        
+        label = CoreLabel(text=text, font_size=font_size, color=(1, 1, 1, 1))
+        label.refresh()
+        texture = label.texture
+        cls.label_textures[key] = texture
+        if len(cls.label_textures) > cls.LABEL_CACHE_SIZE:
+            cls.label_textures.popitem(last=False)
+        return texture
     
     def on_touch_down(self, touch):
         if not self.collide_point(*touch.pos):
             return False
         
         track_radius = dp(25)
+        self.calculate_positions()
         
         for i, pos_data in enumerate(self.track_positions):
             x, y = pos_data['x'], pos_data['y']
@@ -204,7 +253,7 @@ class VinylDiscWidget(Widget):
             if distance <= track_radius:
                 track = pos_data['track']
                 
-                if track.get('local_path') and self.callback:
+                if self.callback:
                     self.callback(track)
                 
                 return True
@@ -226,11 +275,17 @@ class TrackListWidget(BoxLayout):
         self.add_widget(self.scroll)
     
     def set_tracks(self, tracks, on_add_callback=None):
-        self.tracks = tracks
+        self.tracks = []
         self.on_add_callback = on_add_callback
         self.track_list.clear_widgets()
-        
-        for i, track in enumerate(tracks):
+        self.append_tracks(tracks)
+    
+    def append_tracks(self, tracks):
+        """Append rows below the existing ones (used while search results stream in)"""
+        for track in tracks:
+            i = len(self.tracks)
+            self.tracks.append(track)
+            
             # Add original index to track info
             track['original_index'] = i + 1
             
@@ -315,11 +370,22 @@ class TrackListWidget(BoxLayout):
             instance.bg_rect.size = instance.size
 
 class SearchScreen(Screen):
+    # Rows appended to the track list per frame while results stream in
+    STREAM_BATCH_SIZE = 5
+    
     def __init__(self, app=None, **kwargs):
         super().__init__(**kwargs)
         self.app = app
         self.search_results = []
         
+        # Streaming search state
+        self.search_generation = 0
+        self.pending_results = []
+        self.pending_lock = threading.Lock()
+        self.search_done = True
+        self.results_shown = False
+        self.stream_event = None
+        
         # Main layout - initially single layout
         self.main_layout = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10))
         
@@ -367,6 +433,10 @@ class SearchScreen(Screen):
         local_btn.bind(on_press=self.open_file_chooser)
         search_layout.add_widget(local_btn)
         
+        library_btn = GradientButton(text='THU VIEN', size_hint=(None, 1), width=dp(80))
+        library_btn.bind(on_press=self.show_library)
+        search_layout.add_widget(library_btn)
+        
         clear_btn = GradientButton(text='XOA', size_hint=(None, 1), width=dp(60))
         clear_btn.bind(on_press=self.clear_results)
         search_layout.add_widget(clear_btn)
@@ -403,7 +473,7 @@ class SearchScreen(Screen):
         self.bg_rect.size = instance.size
     
     def on_add_track_to_disc(self, track_info):
-        """Add track to disc and download if needed"""
+        """Add track to disc and download in background if needed"""
         print(f"Adding track to disc: {track_info.get('title', 'Unknown')}")
         
         # Check if track already on disc
@@ -412,33 +482,40 @@ class SearchScreen(Screen):
                 print("Track already on disc, skipping")
                 return
         
-        if track_info.get('local_path'):
-            # Already downloaded, add directly
-            print("Track already downloaded, adding to disc")
-            self.vinyl_disc.add_track_to_disc(track_info)
-        else:
-            # Need to download first
-            print("Need to download track first")
-            # Show downloading status
-            self.status_label.text = f'Dang tai: {track_info.get("title", "Unknown")[:30]}...'
+        local_path = track_info.get('local_path')
+        if local_path and not os.path.exists(local_path):
+            # Stale library row: cache file evicted/quarantined or local file deleted
+            print(f"File missing, forgetting: {local_path}")
+            self.app.library.forget_path(local_path)
+            track_info['local_path'] = None
+            if track_info.get('platform') == 'Local':
+                self.update_status('File khong con tren may', (1, 0, 0, 1))
+                return
+        
+        if not track_info.get('local_path'):
+            # Downloaded in an earlier session? Indexed lookup in the library
+            known = self.app.library.find_by_url(track_info.get('url'))
+            if known and known.get('local_path') and os.path.exists(known['local_path']):
+                track_info['local_path'] = known['local_path']
+        
+        # Track goes on the disc right away; it turns green once downloaded
+        self.vinyl_disc.add_track_to_disc(track_info)
+        self.app.on_queue_changed(self.vinyl_disc.selected_tracks)
+        
+        if not track_info.get('local_path'):
+            self.status_label.text = f'Dang cho tai: {track_info.get("title", "Unknown")[:30]}...'
             self.status_label.color = (1, 1, 0, 1)
-            
-            def on_complete(success, filepath=None):
-                print(f"Download complete: success={success}, filepath={filepath}")
-                if success:
-                    track_info['local_path'] = filepath
-                    self.vinyl_disc.add_track_to_disc(track_info)
-                    self.status_label.text = f'Da them: {track_info.get("title", "Unknown")[:30]}...'
-                    self.status_label.color = (0, 1, 0, 1)
-                    print("Track added to disc after download")
-                else:
-                    self.status_label.text = 'Loi tai nhac - Thu lai'
-                    self.status_label.color = (1, 0, 0, 1)
-                    print("Download failed")
-            
-            self.download_track(track_info, on_complete)
+            self.download_track(track_info, PRIORITY_BACKGROUND)
     
-
+    def on_download_complete(self, track_info, job):
+        print(f"Download complete: status={job.status}, filepath={job.filepath}")
+        if job.status == DownloadJob.DONE:
+            track_info['local_path'] = job.filepath
+            self.status_label.text = f'Da tai: {track_info.get("title", "Unknown")[:30]}...'
+            self.status_label.color = (0, 1, 0, 1)
+        elif job.status == DownloadJob.FAILED:
+            self.status_label.text = 'Loi tai nhac - Thu lai'
+            self.status_label.color = (1, 0, 0, 1)
     
     def switch_to_split_layout(self):
         """Chuyển sang layout 2 cột khi có kết quả"""
@@ -497,7 +574,9 @@ class SearchScreen(Screen):
         pass
     
     def clear_results(self, *args):
+        self.cancel_streaming()
         self.vinyl_disc.clear_disc()
+        self.app.on_queue_changed(self.vinyl_disc.selected_tracks)
         self.search_results = []
         self.status_label.text = 'Da xoa - San sang tim kiem moi'
         self.status_label.color = (0, 1, 0, 1)
@@ -510,91 +589,186 @@ class SearchScreen(Screen):
         if not query:
             return
         
+        self.cancel_streaming()
+        
+        cached, stale = self.app.search_cache.get(query)
+        if cached is not None:
+            # Show cached results instantly; refresh in background if stale
+            self.search_results = cached
+            self.display_results(cached)
+            self.update_status(f'Tim thay {len(cached)} bai', (0, 1, 0, 1))
+            if stale:
+                threading.Thread(target=self.refresh_search, args=(query,), daemon=True).start()
+            return
+        
         self.status_label.text = 'Dang tim kiem...'
         self.status_label.color = (1, 1, 0, 1)
         
+        generation = self.search_generation
+        self.search_results = []
+        self.search_done = False
+        self.results_shown = False
+        self.stream_event = Clock.schedule_interval(lambda dt: self.drain_results(generation), 0)
+        
         def search_thread():
+            tracks = []
+            error = None
             try:
-                search_query = f"scsearch30:{query}"
-                ydl_opts = {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extract_flat': True,
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    results = ydl.extract_info(search_query, download=False)
-                    
-                    if results and 'entries' in results:
-                        tracks = []
-                        for entry in results['entries'][:30]:
-                            if entry:
-                                track_info = {
-                                    'title': entry.get('title', 'Unknown Title'),
-                                    'artist': entry.get('uploader', 'Unknown Artist'),
-                                    'duration': self.format_duration(entry.get('duration', 0)),
-                                    'url': entry.get('webpage_url', ''),
-                                    'platform': 'SoundCloud'
-                                }
-                                tracks.append(track_info)
-                        
-                        self.search_results = tracks
-                        Clock.schedule_once(lambda dt: self.display_results(tracks), 0)
-                        Clock.schedule_once(lambda dt: self.update_status(f'Tim thay {len(tracks)} bai', (0, 1, 0, 1)), 0)
-                    else:
-                        Clock.schedule_once(lambda dt: self.update_status('Khong tim thay', (1, 0, 0, 1)), 0)
-                        
+                for track in self.iter_search(query):
+                    if generation != self.search_generation:
+                        return
+                    tracks.append(track)
+                    with self.pending_lock:
+                        self.pending_results.append(track)
             except Exception as e:
-                Clock.schedule_once(lambda dt: self.update_status(f'Loi: {str(e)[:30]}', (1, 0, 0, 1)), 0)
+                error = e
+            
+            if tracks and not error:
+                self.app.search_cache.put(query, tracks)
+            Clock.schedule_once(lambda dt: self.finish_search(generation, len(tracks), error), 0)
         
         threading.Thread(target=search_thread, daemon=True).start()
     
+    def cancel_streaming(self):
+        """Results from older searches still running are ignored from now on"""
+        self.search_generation += 1
+        with self.pending_lock:
+            self.pending_results = []
+        if self.stream_event:
+            self.stream_event.cancel()
+            self.stream_event = None
+        self.search_done = True
+    
+    def drain_results(self, generation):
+        """Kivy clock callback: move a small batch of streamed results into the list"""
+        if generation != self.search_generation:
+            return False
+        
+        with self.pending_lock:
+            batch = self.pending_results[:self.STREAM_BATCH_SIZE]
+            del self.pending_results[:self.STREAM_BATCH_SIZE]
+            remaining = len(self.pending_results)
+        
+        if batch:
+            if not self.results_shown:
+                self.display_results([])
+                self.results_shown = True
+            self.search_results.extend(batch)
+            if self.track_list:
+                self.track_list.append_tracks(batch)
+            if not self.search_done:
+                self.update_status(f'Dang tim kiem... {len(self.search_results)} bai', (1, 1, 0, 1))
+        
+        if self.search_done and not remaining:
+            self.stream_event = None
+            return False
+        return True
+    
+    def finish_search(self, generation, count, error):
+        if generation != self.search_generation:
+            return
+        self.search_done = True
+        
+        if error:
+            self.update_status(f'Loi: {str(error)[:30]}', (1, 0, 0, 1))
+        elif count:
+            self.update_status(f'Tim thay {count} bai', (0, 1, 0, 1))
+        else:
+            self.update_status('Khong tim thay', (1, 0, 0, 1))
+    
+    def iter_search(self, query):
+        """Run scsearch on SoundCloud, yielding track dicts as entries are resolved"""
+        search_query = f"scsearch30:{query}"
+        
+        with self.app.ydl_pool.borrow('search') as ydl:
+            # process=False keeps 'entries' lazy, so each entry is yielded as soon as it arrives
+            results = ydl.extract_info(search_query, download=False, process=False)
+            
+            if results and 'entries' in results:
+                for entry in itertools.islice(results['entries'], 30):
+                    if entry:
+                        yield {
+                            'title': entry.get('title', 'Unknown Title'),
+                            'artist': entry.get('uploader', 'Unknown Artist'),
+                            'duration': self.format_duration(entry.get('duration', 0)),
+                            'duration_s': entry.get('duration') or 0,
+                            'url': entry.get('webpage_url') or entry.get('url', ''),
+                            'platform': 'SoundCloud'
+                        }
+    
+    def run_search(self, query):
+        """Run scsearch on SoundCloud, returns a list of track dicts"""
+        return list(self.iter_search(query))
+    
+    def refresh_search(self, query):
+        """Stale-while-revalidate: re-run a cached query and update the list if it changed"""
+        try:
+            tracks = self.run_search(query)
+        except Exception as e:
+            print(f"Search refresh error: {e}")
+            return
+        
+        if not tracks:
+            return
+        self.app.search_cache.put(query, tracks)
+        
+        def apply(dt):
+            # Only update if the user is still looking at this query
+            if SearchCache.normalize(self.search_input.text) != SearchCache.normalize(query):
+                return
+            if [t.get('url') for t in tracks] == [t.get('url') for t in self.search_results]:
+                return
+            # Keep the disc as is, only refresh the list
+            self.search_results = tracks
+            if self.track_list:
+                self.track_list.set_tracks(tracks, on_add_callback=self.on_add_track_to_disc)
+        
+        Clock.schedule_once(apply, 0)
+    
     def display_results(self, tracks):
         # Switch to split layout when showing results
         self.switch_to_split_layout()
         
         # Clear disc but keep it rotating
         self.vinyl_disc.clear_disc()
+        self.app.on_queue_changed(self.vinyl_disc.selected_tracks)
         self.vinyl_disc.set_callback(self.on_track_select)
         
         if self.track_list:
             self.track_list.set_tracks(tracks, on_add_callback=self.on_add_track_to_disc)
     
-    def download_track(self, track_info, complete_callback):
-        def download_thread():
-            try:
-                import tempfile
-                temp_dir = tempfile.gettempdir()
-                
-                print(f"Starting download for: {track_info.get('title', 'Unknown')}")
-                print(f"URL: {track_info.get('url', '')}")
-                
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-                    'quiet': True,
-                    'no_warnings': True,
-                    'retries': 3,
-                    'fragment_retries': 3,
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(track_info['url'], download=True)
-                    filepath = ydl.prepare_filename(info)
-                    
-                    # Check if file actually exists and has reasonable size
-                    if os.path.exists(filepath) and os.path.getsize(filepath) > 1000:  # At least 1KB
-                        print(f"Download successful: {filepath} ({os.path.getsize(filepath)} bytes)")
-                        Clock.schedule_once(lambda dt: complete_callback(True, filepath), 0)
-                    else:
-                        print(f"Download failed: File doesn't exist or too small")
-                        Clock.schedule_once(lambda dt: complete_callback(False), 0)
-                    
-            except Exception as e:
-                print(f"Download error: {e}")
-                Clock.schedule_once(lambda dt: complete_callback(False), 0)
-        
-        threading.Thread(target=download_thread, daemon=True).start()
+    def show_library(self, *args):
+        """Show tracks already on disk (scanned folders + downloads), filtered by the search box"""
+        self.cancel_streaming()
+        query = self.search_input.text.strip()
+        tracks = []
+        for track in self.app.library.search(query):
+            # Library rows can outlive their files (cache eviction, files deleted outside the app)
+            if not os.path.exists(track['local_path']):
+                self.app.library.forget_path(track['local_path'])
+                continue
+            tracks.append(track)
+        for track in tracks:
+            track['duration'] = self.format_duration(track.get('duration_s'))
+        
+        self.search_results = tracks
+        self.display_results(tracks)
+        if tracks:
+            self.update_status(f'Thu vien: {len(tracks)} bai', (0, 1, 0, 1))
+        else:
+            self.update_status('Thu vien trong', (1, 0, 0, 1))
+    
+    def download_track(self, track_info, priority=PRIORITY_BACKGROUND):
+        """Queue a download on the shared download manager"""
+        print(f"Queue download for: {track_info.get('title', 'Unknown')}")
+        print(f"URL: {track_info.get('url', '')}")
+        
+        return self.app.download_manager.submit(
+            track_info['url'],
+            priority=priority,
+            callback=lambda job: self.on_download_complete(track_info, job),
+            title=track_info.get('title')
+        )
     
     def refresh_track_list(self):
         if self.track_list:
@@ -611,15 +785,18 @@ class SearchScreen(Screen):
         self.status_label.color = color
     
     def on_track_select(self, track_info):
-        if track_info.get('local_path'):
-            track_info['url'] = track_info['local_path']
-        self.app.play_track(track_info, self.search_results, self.search_results.index(track_info))
+        # The disc is the play queue; tracks not downloaded yet jump ahead of background work
+        if not track_info.get('local_path'):
+            self.update_status(f'Dang tai: {track_info.get("title", "Unknown")[:30]}...', (1, 1, 0, 1))
+        
+        queue = self.vinyl_disc.selected_tracks
+        self.app.play_queue_index(queue.index(track_info), queue)
     
     def open_file_chooser(self, *args):
         content = BoxLayout(orientation='vertical')
         
         filechooser = FileChooserListView(
-            filters=['*.mp3', '*.wav', '*.ogg', '*.m4a', '*.flac', '*.aac']
+            filters=[lambda folder, filename: AudioUtils.is_audio_file(filename)]
         )
         content.add_widget(filechooser)
         
@@ -637,10 +814,12 @@ class SearchScreen(Screen):
         def on_select(*args):
             if filechooser.selection:
                 filepath = filechooser.selection[0]
+                known = self.app.library.add_local_file(filepath)
+                duration_s = known.get('duration_s') if known else None
                 track_info = {
                     'title': os.path.basename(filepath),
                     'artist': 'Local File',
-                    'duration': 'Unknown',
+                    'duration': self.format_duration(duration_s) if duration_s else 'Unknown',
                     'url': filepath,
                     'platform': 'Local',
                     'local_path': filepath
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+
+# Bitrate hợp lý cho file audio (kbps), dùng khi không biết bitrate thực
+MIN_BITRATE_KBPS = 8
+MAX_BITRATE_KBPS = 3200
+
+HEADER_BYTES = 512     # đủ để thấy byte sync của gói MPEG-TS thứ hai
+TS_PACKET_SIZE = 188
+
+class VerificationError(Exception):
+    """File tải về không phải audio hợp lệ (bị cắt, trang lỗi HTML...)"""
+    pass
+
+def sniff_container(path):
+    """Nhận dạng container từ header; trả về tên container, 'html' hoặc None"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_BYTES)
+    except OSError:
+        return None
+
+    if len(header) < 12:
+        return None
+    # Trang lỗi/playlist dạng text: kiểm tra trước các byte magic ngắn
+    text = header.lstrip().lower()
+    if text.startswith((b'<!doctype', b'<html', b'<?xml', b'{', b'#extm3u')):
+        return 'html'
+    if header.startswith(b'ID3'):
+        return 'mp3'
+    if header.startswith(b'OggS'):
+        return 'ogg'
+    if header.startswith(b'fLaC'):
+        return 'flac'
+    if header.startswith(b'RIFF') and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[4:8] == b'ftyp':
+        return 'mp4'
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'webm'
+    if header.startswith(b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'):
+        return 'wma'
+    if header[0] == 0xff and (header[1] & 0xf6) == 0xf0:
+        return 'aac'
+    if header[0] == 0xff and (header[1] & 0xe0) == 0xe0:
+        return 'mp3'
+    # MPEG-TS: byte sync 0x47 lặp lại ở đầu mỗi gói 188 byte (một byte 'G' thì chỉ là text)
+    if len(header) > TS_PACKET_SIZE and header[0] == 0x47 and header[TS_PACKET_SIZE] == 0x47:
+        return 'mpegts'
+    return None
+
+def looks_like_audio(path):
+    container = sniff_container(path)
+    return container is not None and container != 'html'
+
+def verify_download(path, info=None):
+    """Kiểm tra header, dung lượng và duration; raise VerificationError nếu hỏng"""
+    info = info or {}
+    if not os.path.exists(path):
+        raise VerificationError("File không tồn tại")
+
+    size = os.path.getsize(path)
+    if size <= 1000:
+        raise VerificationError(f"File quá nhỏ ({size} bytes)")
+
+    container = sniff_container(path)
+    if container == 'html':
+        raise VerificationError("Nhận được trang HTML/playlist thay vì audio")
+    if container is None:
+        raise VerificationError("Header không phải định dạng audio đã biết")
+
+    # Dung lượng phải khớp số byte server báo (filesize chính xác, filesize_approx thì nới)
+    expected = info.get('filesize')
+    if expected and abs(size - expected) > max(expected * 0.01, 4096):
+        raise VerificationError(f"Dung lượng {size} khác với dự kiến {expected}")
+    approx = info.get('filesize_approx')
+    if not expected and approx and size < approx * 0.5:
+        raise VerificationError(f"Dung lượng {size} quá nhỏ so với ước tính {approx}")
+
+    # Duration hợp lý: so với bitrate khai báo, hoặc một khoảng bitrate rộng
+    duration = info.get('duration')
+    if duration and duration > 0:
+        kbps = size * 8 / 1000.0 / duration
+        abr = info.get('abr') or info.get('tbr')
+        if abr and kbps < abr * 0.5:
+            raise VerificationError(f"File bị cắt: {kbps:.0f} kbps so với {abr:.0f} kbps")
+        if kbps < MIN_BITRATE_KBPS or kbps > MAX_BITRATE_KBPS:
+            raise VerificationError(f"Bitrate {kbps:.0f} kbps không hợp lý cho {duration}s")
+
+    return container
@@ -1,26 +1,63 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import random
-import math
+import numpy as np
 from kivy.uix.widget import Widget
-from kivy.graphics import Color, Rectangle
+from kivy.graphics import RenderContext, Mesh
 from kivy.clock import Clock
+from kivy.logger import Logger
 from kivy.metrics import dp
 
+# Shader cho mesh có màu theo từng đỉnh (Kivy mặc định chỉ có một màu cho cả instruction)
+# Ghi đủ các varying của header: vs được link với fs mặc định trước khi gán fs riêng
+VERTEX_SHADER = '''
+$HEADER$
+attribute vec4 vColor;
+
+void main(void) {
+    frag_color = vColor * vec4(1.0, 1.0, 1.0, opacity);
+    tex_coord0 = vec2(0.0, 0.0);
+    gl_Position = projection_mat * modelview_mat * vec4(vPosition.xy, 0.0, 1.0);
+}
+'''
+
+FRAGMENT_SHADER = '''
+$HEADER$
+
+void main(void) {
+    gl_FragColor = frag_color;
+}
+'''
+
+VERTEX_FORMAT = [(b'vPosition', 2, 'float'), (b'vColor', 4, 'float')]
+BACKGROUND_COLOR = (0.02, 0.02, 0.08, 0.95)
+
 class AudioVisualizer(Widget):
-    def __init__(self, **kwargs):
+    COLOR_LUT_SIZE = 512
+    MAX_AMPLITUDE = 2.0
+    QUADS_PER_BAR = 3  # cột, glow, phản chiếu
+    
+    def __init__(self, bar_count=120, **kwargs):
+        # Vẽ toàn bộ bằng một Mesh giữ nguyên qua các frame, chỉ ghi lại vertex buffer
+        self.canvas = RenderContext(use_parent_projection=True, use_parent_modelview=True)
+        self.canvas.shader.vs = VERTEX_SHADER
+        self.canvas.shader.fs = FRAGMENT_SHADER
+        if not self.canvas.shader.success:
+            Logger.error("AudioVisualizer: Lỗi compile shader")
         super().__init__(**kwargs)
         
-        self.bar_count = 120
+        self.bar_count = bar_count
         self.bar_width = dp(6)
         self.bar_spacing = dp(2)
         self.max_height = dp(300)
         self.min_height = dp(8)
         
-        self.audio_data = [0.1] * self.bar_count
-        self.target_data = [0.1] * self.bar_count
-        self.velocity_data = [0.0] * self.bar_count
+        # Trạng thái của tất cả các cột nằm trong mảng NumPy, mỗi frame chỉ là vài phép toán mảng
+        self.audio_data = np.full(self.bar_count, 0.1, dtype=np.float32)
+        self.target_data = np.full(self.bar_count, 0.1, dtype=np.float32)
+        self.velocity_data = np.zeros(self.bar_count, dtype=np.float32)
+        self.freq_base = np.arange(self.bar_count, dtype=np.float32) / self.bar_count * 2 * np.pi
+        self.color_phase = np.arange(self.bar_count, dtype=np.float32) * 0.1
         
         self.scroll_offset = 0
         self.is_playing = False
@@ -35,9 +72,14 @@ class AudioVisualizer(Widget):
             (0.8, 0.2, 1.0, 1),
             (0.2, 0.6, 1.0, 1),
         ]
+        self.color_lut = self.build_color_lut()
         
-        self.bind(size=self.update_graphics)
-        self.bind(pos=self.update_graphics)
+        # Hàm trả về phổ thật (bar_count giá trị) tại vị trí đang phát, None nếu chưa có
+        self.spectrum_source = None
+        
+        self.build_mesh()
+        self.bind(size=self.update_layout)
+        self.bind(pos=self.update_layout)
         self.animation_event = None
     
     def start_animation(self):
@@ -55,14 +97,10 @@ class AudioVisualizer(Widget):
     
     def fade_out_animation(self):
         def fade_step(dt):
-            fade_complete = True
-            for i in range(self.bar_count):
-                if self.audio_data[i] > 0.05:
-                    self.audio_data[i] *= 0.95
-                    fade_complete = False
-            
-            if fade_complete:
+            fading = self.audio_data > 0.05
+            if not fading.any():
                 return False
+            self.audio_data[fading] *= 0.95
             
             self.update_graphics()
             return True
@@ -76,30 +114,30 @@ class AudioVisualizer(Widget):
         self.time_accumulator += dt
         self.scroll_offset += dp(2)
         
-        self.generate_smooth_audio_data(dt)
+        spectrum = self.spectrum_source() if self.spectrum_source else None
+        if spectrum is not None:
+            self.set_audio_data(spectrum)
+        else:
+            self.generate_smooth_audio_data(dt)
         self.apply_physics_smoothing(dt)
         self.update_graphics()
     
     def generate_smooth_audio_data(self, dt):
         time_factor = self.time_accumulator
+        freq_base = self.freq_base
         
-        for i in range(self.bar_count):
-            freq_base = i / self.bar_count * 2 * math.pi
-            
-            bass = math.sin(time_factor * 2.0 + freq_base * 0.5) * 0.6
-            mid = math.sin(time_factor * 4.0 + freq_base * 1.5) * 0.4
-            high = math.sin(time_factor * 8.0 + freq_base * 3.0) * 0.3
-            
-            noise = (random.random() - 0.5) * 0.1
-            amplitude = abs(bass + mid + high + noise)
-            
-            beat = abs(math.sin(time_factor * 3.0)) * 0.4
-            amplitude += beat
-            
-            amplitude = max(0.05, min(1.5, amplitude))
-            amplitude = self.smooth_curve(amplitude)
-            
-            self.target_data[i] = amplitude
+        bass = np.sin(time_factor * 2.0 + freq_base * 0.5) * 0.6
+        mid = np.sin(time_factor * 4.0 + freq_base * 1.5) * 0.4
+        high = np.sin(time_factor * 8.0 + freq_base * 3.0) * 0.3
+        
+        noise = (np.random.random(self.bar_count) - 0.5) * 0.1
+        amplitude = np.abs(bass + mid + high + noise)
+        
+        beat = abs(np.sin(time_factor * 3.0)) * 0.4
+        amplitude += beat
+        
+        np.clip(amplitude, 0.05, 1.5, out=amplitude)
+        self.target_data[:] = self.smooth_curve(amplitude)
     
     def smooth_curve(self, value):
         return value * value * (3.0 - 2.0 * value)
@@ -108,105 +146,126 @@ class AudioVisualizer(Widget):
         spring_strength = 15.0
         damping = 8.0
         
-        for i in range(self.bar_count):
-            diff = self.target_data[i] - self.audio_data[i]
-            force = diff * spring_strength
-            
-            self.velocity_data[i] += force * dt
-            self.velocity_data[i] *= (1.0 - damping * dt)
-            
-            self.audio_data[i] += self.velocity_data[i] * dt
-            self.audio_data[i] = max(0.05, min(2.0, self.audio_data[i]))
+        force = (self.target_data - self.audio_data) * spring_strength
+        
+        self.velocity_data += force * dt
+        self.velocity_data *= (1.0 - damping * dt)
+        
+        self.audio_data += self.velocity_data * dt
+        np.clip(self.audio_data, 0.05, self.MAX_AMPLITUDE, out=self.audio_data)
+    
+    def build_mesh(self):
+        """Tạo mesh một lần: quad nền + QUADS_PER_BAR quad mỗi cột, index cố định"""
+        quad_count = 1 + self.bar_count * self.QUADS_PER_BAR
+        # (quad, đỉnh, x y r g b a); các view bên dưới trỏ thẳng vào buffer này
+        self.vertex_buffer = np.zeros((quad_count, 4, 6), dtype=np.float32)
+        self.background_quad = self.vertex_buffer[0]
+        bar_quads = self.vertex_buffer[1:].reshape(self.bar_count, self.QUADS_PER_BAR, 4, 6)
+        self.bar_quads = bar_quads[:, 0]
+        self.glow_quads = bar_quads[:, 1]
+        self.reflection_quads = bar_quads[:, 2]
+        self.background_quad[:, 2:] = BACKGROUND_COLOR
+        
+        base = np.arange(quad_count, dtype=np.int32)[:, None] * 4
+        indices = (base + np.array([0, 1, 2, 2, 3, 0], dtype=np.int32)).ravel()
+        
+        self.canvas.clear()
+        with self.canvas:
+            self.mesh = Mesh(fmt=VERTEX_FORMAT, mode='triangles', indices=indices.tolist())
+        self.update_layout()
+    
+    def update_layout(self, *args):
+        """Vị trí x của các cột chỉ đổi khi widget đổi kích thước/vị trí"""
+        total_width = self.bar_count * (self.bar_width + self.bar_spacing)
+        start_x = self.center_x - total_width / 2
+        
+        if total_width > self.width:
+            available_width = self.width - dp(20)
+            scale_factor = available_width / total_width
+            self.scaled_bar_width = self.bar_width * scale_factor
+            scaled_spacing = self.bar_spacing * scale_factor
+            start_x = self.x + dp(10)
+        else:
+            self.scaled_bar_width = self.bar_width
+            scaled_spacing = self.bar_spacing
+        
+        self.bar_x = start_x + np.arange(self.bar_count, dtype=np.float32) * (self.scaled_bar_width + scaled_spacing)
+        self.write_quads(self.background_quad, self.x, self.y, self.right, self.top)
+        self.update_graphics()
+    
+    @staticmethod
+    def write_quads(quads, x0, y0, x1, y1):
+        """Ghi tọa độ 4 góc (ngược chiều kim đồng hồ) vào các quad, nhận số hoặc mảng"""
+        quads[..., 0, 0] = x0
+        quads[..., 0, 1] = y0
+        quads[..., 1, 0] = x1
+        quads[..., 1, 1] = y0
+        quads[..., 2, 0] = x1
+        quads[..., 2, 1] = y1
+        quads[..., 3, 0] = x0
+        quads[..., 3, 1] = y1
     
     def update_graphics(self, *args):
         if self.size[0] <= 0 or self.size[1] <= 0:
             return
-            
-        self.canvas.clear()
         
-        with self.canvas:
-            Color(0.02, 0.02, 0.08, 0.95)
-            Rectangle(pos=self.pos, size=self.size)
-            
-            total_width = self.bar_count * (self.bar_width + self.bar_spacing)
-            start_x = self.center_x - total_width / 2
-            
-            if total_width > self.width:
-                available_width = self.width - dp(20)
-                scale_factor = available_width / total_width
-                scaled_bar_width = self.bar_width * scale_factor
-                scaled_spacing = self.bar_spacing * scale_factor
-                start_x = self.x + dp(10)
-            else:
-                scaled_bar_width = self.bar_width
-                scaled_spacing = self.bar_spacing
-            
-            for i in range(self.bar_count):
-                bar_x = start_x + i * (scaled_bar_width + scaled_spacing)
-                
-                amplitude = self.audio_data[i]
-                bar_height = self.min_height + amplitude * (self.max_height - self.min_height)
-                bar_y = self.center_y - bar_height / 2
-                
-                color = self.get_smooth_color(amplitude, i)
-                Color(*color)
-                
-                Rectangle(
-                    pos=(bar_x, bar_y),
-                    size=(scaled_bar_width, bar_height)
-                )
-                
-                if amplitude > 0.5:
-                    glow_intensity = (amplitude - 0.5) * 0.4
-                    Color(color[0], color[1], color[2], glow_intensity)
-                    
-                    glow_size = dp(3)
-                    Rectangle(
-                        pos=(bar_x - glow_size/2, bar_y - glow_size),
-                        size=(scaled_bar_width + glow_size, bar_height + glow_size*2)
-                    )
-                
-                if amplitude > 0.3:
-                    reflection_height = bar_height * 0.3 * amplitude
-                    reflection_alpha = 0.15 * amplitude
-                    Color(color[0], color[1], color[2], reflection_alpha)
-                    
-                    Rectangle(
-                        pos=(bar_x, self.center_y - reflection_height),
-                        size=(scaled_bar_width, reflection_height)
-                    )
-    
-    def get_smooth_color(self, amplitude, index):
-        color_float = amplitude * (len(self.colors) - 1)
-        color_index = int(color_float)
-        blend_factor = color_float - color_index
-        
-        color_index = max(0, min(len(self.colors) - 2, color_index))
-        
-        color1 = self.colors[color_index]
-        color2 = self.colors[color_index + 1]
-        
-        blended_color = (
-            color1[0] + (color2[0] - color1[0]) * blend_factor,
-            color1[1] + (color2[1] - color1[1]) * blend_factor,
-            color1[2] + (color2[2] - color1[2]) * blend_factor,
-            color1[3]
-        )
+        amplitude = self.audio_data
+        colors = self.get_smooth_colors()
+        bar_x = self.bar_x
+        bar_right = bar_x + self.scaled_bar_width
+        bar_height = self.min_height + amplitude * (self.max_height - self.min_height)
+        bar_y = self.center_y - bar_height / 2
         
-        time_offset = self.time_accumulator * 2.0 + index * 0.1
-        color_variation = math.sin(time_offset) * 0.1
+        self.write_quads(self.bar_quads, bar_x, bar_y, bar_right, bar_y + bar_height)
+        self.bar_quads[:, :, 2:] = colors[:, None, :]
         
-        return (
-            max(0, min(1, blended_color[0] + color_variation)),
-            max(0, min(1, blended_color[1] + color_variation)),
-            max(0, min(1, blended_color[2] + color_variation)),
-            blended_color[3]
+        # Glow và phản chiếu luôn có trong mesh; cột thấp thì alpha = 0
+        glow_size = dp(3)
+        self.write_quads(
+            self.glow_quads, bar_x - glow_size / 2, bar_y - glow_size,
+            bar_right + glow_size / 2, bar_y + bar_height + glow_size
         )
+        self.glow_quads[:, :, 2:5] = colors[:, None, :3]
+        self.glow_quads[:, :, 5] = np.where(amplitude > 0.5, (amplitude - 0.5) * 0.4, 0.0)[:, None]
+        
+        reflection_height = bar_height * 0.3 * amplitude
+        self.write_quads(
+            self.reflection_quads, bar_x, self.center_y - reflection_height,
+            bar_right, self.center_y
+        )
+        self.reflection_quads[:, :, 2:5] = colors[:, None, :3]
+        self.reflection_quads[:, :, 5] = np.where(amplitude > 0.3, 0.15 * amplitude, 0.0)[:, None]
+        
+        self.mesh.vertices = self.vertex_buffer.ravel()
+    
+    def build_color_lut(self):
+        """Bảng màu theo amplitude (0..MAX_AMPLITUDE), tính một lần thay cho nội suy từng cột mỗi frame"""
+        colors = np.array(self.colors, dtype=np.float32)
+        amplitude = np.linspace(0, self.MAX_AMPLITUDE, self.COLOR_LUT_SIZE, dtype=np.float32)
+        
+        color_float = amplitude * (len(colors) - 1)
+        color_index = color_float.astype(np.int32)
+        blend_factor = (color_float - color_index)[:, None]
+        color_index = np.clip(color_index, 0, len(colors) - 2)
+        
+        lut = colors[color_index] + (colors[color_index + 1] - colors[color_index]) * blend_factor
+        lut[:, 3] = colors[color_index, 3]
+        return lut
+    
+    def get_smooth_colors(self):
+        """Màu RGBA (bar_count, 4) của các cột: tra LUT theo amplitude + dao động nhẹ theo thời gian"""
+        scale = (self.COLOR_LUT_SIZE - 1) / self.MAX_AMPLITUDE
+        index = np.clip((self.audio_data * scale).astype(np.int32), 0, self.COLOR_LUT_SIZE - 1)
+        colors = self.color_lut[index]
+        
+        color_variation = np.sin(self.time_accumulator * 2.0 + self.color_phase) * 0.1
+        colors[:, :3] += color_variation[:, None]
+        np.clip(colors[:, :3], 0, 1, out=colors[:, :3])
+        return colors
     
     def set_audio_data(self, data):
         if len(data) == self.bar_count:
-            for i in range(self.bar_count):
-                self.target_data[i] = data[i]
+            self.target_data[:] = data
     
     def set_playing(self, is_playing):
         if is_playing:
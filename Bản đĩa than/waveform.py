@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from transcode import sidecar_path
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SIDECAR_SUFFIX = '.peaks.npy'
+
+class WaveformPeaks:
+    """Đường bao min/max của cả bài cho thanh seek: tính một lần ở luồng nền,
+    lưu <key>.peaks.npy cạnh file trong cache (bị xóa cùng file khi evict)"""
+    SAMPLE_RATE = 8000
+    BUCKET = 256            # ~32 ms mỗi cặp min/max
+    COLUMNS = 240           # số cột trên thanh seek
+    READ_BYTES = 8000 * 2 * 4  # đọc ~4 giây PCM mỗi lần
+
+    def __init__(self, ffmpeg_path=None, cache_dir=None):
+        self.ffmpeg = ffmpeg_path or shutil.which('ffmpeg')
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='peaks')
+
+    def available(self):
+        return NUMPY_AVAILABLE and self.ffmpeg is not None
+
+    @staticmethod
+    def sidecar_path(path):
+        return sidecar_path(path, SIDECAR_SUFFIX)
+
+    def on_track_cached(self, path):
+        """Post-processor của DownloadManager: tính peaks ở nền sau mỗi lần tải xong"""
+        if self.available() and not os.path.exists(self.sidecar_path(path)):
+            self.executor.submit(self.build_sidecar, path)
+
+    def load(self, path, callback):
+        """callback(peaks) trên luồng Kivy, peaks là mảng (COLUMNS, 2) min/max trong -1..1.
+        Chỉ bài được load gần nhất mới nhận kết quả."""
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        if not NUMPY_AVAILABLE or not path or not os.path.exists(path):
+            return
+        self.executor.submit(self._load, path, generation, callback)
+
+    def shutdown(self):
+        with self.lock:
+            self.generation += 1
+        self.executor.shutdown(wait=False)
+
+    def _load(self, path, generation, callback):
+        if generation != self.generation:
+            return
+        peaks = self.open_sidecar(path)
+        if peaks is None and self.available():
+            # File ngoài cache (chọn từ máy, thư mục nhạc): chỉ tính trong bộ nhớ, không ghi vào thư mục của người dùng
+            peaks = self.build_sidecar(path) if self.in_cache(path) else self.compute(path)
+        if peaks is None or generation != self.generation:
+            return
+        columns = self.resample(peaks, self.COLUMNS)
+        Clock.schedule_once(lambda dt: callback(columns) if generation == self.generation else None, 0)
+
+    def open_sidecar(self, path):
+        sidecar = self.sidecar_path(path)
+        if not os.path.exists(sidecar):
+            return None
+        try:
+            peaks = np.load(sidecar)
+        except (OSError, ValueError) as e:
+            Logger.warning(f"WaveformPeaks: Sidecar hỏng {os.path.basename(sidecar)} - {e}")
+            return None
+        if peaks.ndim != 2 or peaks.shape[1] != 2 or peaks.dtype != np.int8 or not len(peaks):
+            return None
+        return peaks
+
+    def in_cache(self, path):
+        return self.cache_dir is not None and os.path.abspath(path).startswith(self.cache_dir + os.sep)
+
+    def compute(self, path):
+        """Giải mã cả bài bằng ffmpeg -> peaks int8 (n, 2); None nếu lỗi"""
+        try:
+            peaks = self.extract(path)
+        except (OSError, RuntimeError, ValueError) as e:
+            Logger.error(f"WaveformPeaks: Lỗi phân tích {os.path.basename(path)} - {e}")
+            return None
+        return peaks if len(peaks) else None
+
+    def build_sidecar(self, path):
+        """compute() rồi lưu cạnh file trong cache"""
+        peaks = self.compute(path)
+        if peaks is None:
+            return None
+
+        sidecar = self.sidecar_path(path)
+        tmp_path = sidecar + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, peaks)
+            os.replace(tmp_path, sidecar)
+        except OSError as e:
+            Logger.error(f"WaveformPeaks: Lỗi ghi sidecar {os.path.basename(sidecar)} - {e}")
+        else:
+            Logger.info(f"WaveformPeaks: Đã lưu {os.path.basename(sidecar)} ({len(peaks)} cặp)")
+        return peaks
+
+    def extract(self, path):
+        cmd = [
+            self.ffmpeg, '-v', 'error', '-i', path,
+            '-vn', '-ac', '1', '-ar', str(self.SAMPLE_RATE), '-f', 's16le', '-',
+        ]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        blocks = []
+        pending = b''
+        try:
+            while True:
+                data = process.stdout.read(self.READ_BYTES)
+                if not data:
+                    break
+                # Giữ lại phần chưa đủ một bucket (và byte lẻ) cho lần đọc sau
+                data = pending + data
+                usable = len(data) - len(data) % (self.BUCKET * 2)
+                pending = data[usable:]
+                if usable:
+                    blocks.append(self.bucket_peaks(np.frombuffer(data[:usable], dtype=np.int16)))
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg thoát với mã {process.returncode}")
+        finally:
+            process.kill()
+            process.stdout.close()
+            process.wait()
+
+        tail = np.frombuffer(pending[:len(pending) - len(pending) % 2], dtype=np.int16)
+        if len(tail):
+            blocks.append(self.bucket_peaks(tail, len(tail)))
+        if not blocks:
+            return np.zeros((0, 2), dtype=np.int8)
+        return np.concatenate(blocks)
+
+    def bucket_peaks(self, samples, bucket=None):
+        """int16 -> (số bucket, 2) min/max, lượng tử về int8"""
+        buckets = samples.reshape(-1, bucket or self.BUCKET)
+        peaks = np.stack((buckets.min(axis=1), buckets.max(axis=1)), axis=1)
+        return (peaks >> 8).astype(np.int8)
+
+    @staticmethod
+    def resample(peaks, columns):
+        """Gộp các bucket thành đúng số cột cần vẽ (bài ngắn hơn thì giữ nguyên số bucket)"""
+        if len(peaks) > columns:
+            starts = (np.arange(columns) * len(peaks)) // columns
+            peaks = np.stack((
+                np.minimum.reduceat(peaks[:, 0], starts),
+                np.maximum.reduceat(peaks[:, 1], starts),
+            ), axis=1)
+        return peaks.astype(np.float32) / 128.0
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+import yt_dlp
+from kivy.logger import Logger
+
+import settings
+
+def search_options():
+    return {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True,
+    }
+
+def download_options(staging_dir, format_selector='bestaudio/best'):
+    return {
+        'format': format_selector,
+        'outtmpl': os.path.join(staging_dir, '%(id)s.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'retries': 3,
+        'fragment_retries': 3,
+        # Giữ file .part (và .ytdl cho fragment) để lần sau tải tiếp
+        'continuedl': True,
+        'nopart': False,
+    }
+
+class YdlPool:
+    """Pool các YoutubeDL cấu hình sẵn, sống lâu để tái sử dụng extractor và HTTP session"""
+    def __init__(self, staging_dir, search_size=None, download_size=None):
+        self.profiles = {
+            'search': (search_options(), search_size or settings.YDL_SEARCH_POOL_SIZE),
+            'download': (download_options(staging_dir), download_size or settings.DOWNLOAD_WORKERS),
+        }
+        self.idle = {name: queue.LifoQueue() for name in self.profiles}
+        self.created = {name: 0 for name in self.profiles}
+        self.lock = threading.Lock()
+
+    def _create(self, profile):
+        options = dict(self.profiles[profile][0])
+        ydl = yt_dlp.YoutubeDL(options)
+        # Một hook cố định chuyển tiếp tới các hook của lần mượn hiện tại
+        ydl.pool_hooks = []
+        ydl.add_progress_hook(lambda d, ydl=ydl: [hook(d) for hook in ydl.pool_hooks])
+        Logger.info(f"YdlPool: Tạo YoutubeDL mới cho profile '{profile}'")
+        return ydl
+
+    def _acquire(self, profile):
+        try:
+            return self.idle[profile].get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            can_create = self.created[profile] < self.profiles[profile][1]
+            if can_create:
+                self.created[profile] += 1
+        if can_create:
+            try:
+                return self._create(profile)
+            except Exception:
+                with self.lock:
+                    self.created[profile] -= 1
+                raise
+        # Đã đủ số lượng: chờ instance được trả lại
+        return self.idle[profile].get()
+
+    @contextmanager
+    def borrow(self, profile, format_selector=None, progress_hooks=()):
+        """Mượn một YoutubeDL; các tham số theo lần gọi được reset khi trả lại"""
+        ydl = self._acquire(profile)
+        default_format = self.profiles[profile][0].get('format')
+        try:
+            if format_selector:
+                ydl.params['format'] = format_selector
+            ydl.pool_hooks = list(progress_hooks)
+            yield ydl
+        finally:
+            ydl.pool_hooks = []
+            if default_format:
+                ydl.params['format'] = default_format
+            self.idle[profile].put(ydl)
+
+    def warm(self):
+        """Tạo sẵn các instance ở luồng nền để lần gọi đầu không phải chờ"""
+        def warm_thread():
+            for profile in self.profiles:
+                try:
+                    with self.borrow(profile):
+                        pass
+                except Exception as e:
+                    Logger.warning(f"YdlPool: Lỗi khởi tạo profile '{profile}' - {e}")
+        threading.Thread(target=warm_thread, daemon=True).start()
+
+    def close(self):
+        for profile, idle in self.idle.items():
+            while True:
+                try:
+                    ydl = idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    ydl.__exit__(None, None, None)
+                except Exception:
+                    pass